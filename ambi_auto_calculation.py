@@ -1,28 +1,109 @@
+import io
 import os
+import sys
+import csv
 import time
+import argparse
 import string
+import json
+import queue
+import calendar
+import random
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager, redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from dataclasses import asdict, dataclass, fields
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import gspread
-from google.oauth2.service_account import Credentials
-
-# 環境変数の読み込み
-load_dotenv()
-
-# AMBIログイン情報
-AMBI_LOGIN_URL = os.getenv("AMBI_LOGIN_URL")
-AMBI_LOGIN_ID = os.getenv("AMBI_LOGIN_ID")
-AMBI_PASSWORD = os.getenv("AMBI_PASSWORD")
-
-# 基本URLとデータ種別ごとのエンドポイント
-BASE_URL = "https://en-ambi.com/company/effect_ma"
+from typing import Optional
+from urllib.parse import urljoin
+
+# selenium・webdriver_manager・gspread・google.oauth2・requests・bs4・dotenvは、
+# 使う取得方式・出力先が選ばれたときに関数の中で読み込む（CSV出力やキャッシュだけの実行を速く起動するため）
+
+def load_settings():
+    """
+    環境変数から決まる設定値を読み込む（import時と、load_env_fileで.envファイルを読み込んだ後に呼ばれる）
+    """
+    global AMBI_LOGIN_URL, AMBI_LOGIN_ID, AMBI_PASSWORD, BASE_URL, DRIVER_PROFILE, FETCH_BACKEND
+    global FETCH_CONCURRENCY, FETCH_RATE_PER_SEC, FETCH_RATE_BURST, WRITE_BATCH_DAYS, RANGE_FETCH
+    global CACHE_DB_PATH, CACHE_FORCE_REFRESH, HISTORY_DB_PATH
+    global STATE_DIR, SESSION_COOKIE_FILE, DRIVER_PATH_FILE, CHECKPOINT_FILE, SHEET_SNAPSHOT_FILE
+    global METRICS_JSON_FILE, METRICS_PROM_FILE
+    global ACCOUNTS_FILE, ACCOUNT_WORKERS, SHEET_LAYOUT_FILE, SHEETS_READ_PER_MINUTE, SHEETS_WRITE_PER_MINUTE
+    global DAEMON_INTERVAL_MINUTES, DAEMON_TRIGGER_PORT, DAEMON_TRIGGER_TOKEN
+
+    # AMBIログイン情報
+    AMBI_LOGIN_URL = os.getenv("AMBI_LOGIN_URL")
+    AMBI_LOGIN_ID = os.getenv("AMBI_LOGIN_ID")
+    AMBI_PASSWORD = os.getenv("AMBI_PASSWORD")
+
+    # 基本URL
+    BASE_URL = os.getenv("AMBI_BASE_URL", "https://en-ambi.com/company/effect_ma")
+
+    # Chromeの起動プロファイル ("desktop": 通常のウィンドウ表示, "server": ヘッドレスで画像・CSS・フォントを読み込まない)
+    DRIVER_PROFILE = os.getenv("AMBI_DRIVER_PROFILE", "desktop")
+
+    # データ取得方式（FETCH_BACKENDSのキー）。httpでログインできない場合はseleniumにフォールバックする
+    FETCH_BACKEND = os.getenv("AMBI_FETCH_BACKEND", "http")
+
+    # 並列取得の設定（同時接続数と、1秒あたりのページ取得数の上限）
+    FETCH_CONCURRENCY = int(os.getenv("AMBI_FETCH_CONCURRENCY", "3"))
+    FETCH_RATE_PER_SEC = float(os.getenv("AMBI_FETCH_RATE_PER_SEC", "2"))
+    FETCH_RATE_BURST = int(os.getenv("AMBI_FETCH_RATE_BURST", "1"))
+
+    # 連続した期間を、期間指定の合計値で0件の日を絞り込んでから取得するか（"0"の場合は常に日別に取得する）
+    RANGE_FETCH = os.getenv("AMBI_RANGE_FETCH", "1") == "1"
+
+    # 取得と書き込みを並行する場合の、1回に書き込む日数
+    WRITE_BATCH_DAYS = int(os.getenv("AMBI_WRITE_BATCH_DAYS", "7"))
+
+    # 取得済みページのキャッシュ（今日・昨日は毎回取得し、それより前の日はキャッシュを使う）
+    CACHE_DB_PATH = os.getenv("AMBI_CACHE_DB", "ambi_cache.sqlite3")
+    CACHE_FORCE_REFRESH = os.getenv("AMBI_CACHE_FORCE_REFRESH") == "1"
+
+    # 取得した全実績を蓄積する履歴DB（日付・データ種別・担当者ごとに項目別の列で保存する）
+    HISTORY_DB_PATH = os.getenv("AMBI_HISTORY_DB", "ambi_history.sqlite3")
+
+    # 実行をまたいで再利用する状態（ログインCookie、chromedriverのパス）の保存先
+    STATE_DIR = os.getenv("AMBI_STATE_DIR", ".ambi_state")
+    SESSION_COOKIE_FILE = os.path.join(STATE_DIR, "cookies.json")
+    DRIVER_PATH_FILE = os.path.join(STATE_DIR, "chromedriver_path")
+    CHECKPOINT_FILE = os.path.join(STATE_DIR, "checkpoint.jsonl")
+    # 書き込み先のシートの値のスナップショット（スプレッドシートの最終更新時刻が変わっていなければ読み込みを省略する）
+    SHEET_SNAPSHOT_FILE = os.path.join(STATE_DIR, "sheet_snapshot.json")
+
+    # 実行ごとの計測結果（処理段階ごとの所要時間と、WebDriver・API呼び出しの回数）の出力先
+    # JSONは毎回書き出し、Prometheus（node_exporterのtextfile collector）形式はパスを指定した場合のみ書き出す
+    METRICS_JSON_FILE = os.getenv("AMBI_METRICS_JSON", os.path.join(STATE_DIR, "run_metrics.json"))
+    METRICS_PROM_FILE = os.getenv("AMBI_METRICS_PROM")
+
+    # 複数の企業アカウントを集計する場合のアカウント一覧（JSONファイル）と、同時に実行するプロセス数（既定: CPUコア数）
+    # [{"name": "clientA", "pk": "CA19C6", "login_id": "...", "password_env": "AMBI_PASSWORD_CLIENTA",
+    #   "spreadsheet": "テスト", "sheet_layout": "sheet_layout_clientA.json"}, ...]
+    # passwordを直接書く代わりに、password_envでパスワードを持つ環境変数名を指定できる
+    ACCOUNTS_FILE = os.getenv("AMBI_ACCOUNTS_FILE", "accounts.json")
+    ACCOUNT_WORKERS = int(os.getenv("AMBI_ACCOUNT_WORKERS", "0")) or os.cpu_count() or 1
+
+    # シートのレイアウト（担当者ごと・スカウト種別ごとの書き込み開始行）のJSONファイル
+    # {"担当者名": {"platinum": 行, "regular": 行, "interested": 行}} の形式でDEFAULT_SHEET_LAYOUTを上書きできる
+    SHEET_LAYOUT_FILE = os.getenv("AMBI_SHEET_LAYOUT", "sheet_layout.json")
+
+    # Sheets APIの1分あたりの呼び出し回数の上限（読み込み・書き込み別。既定はGoogleのユーザーごとの上限）
+    SHEETS_READ_PER_MINUTE = int(os.getenv("AMBI_SHEETS_READ_PER_MINUTE", "60"))
+    SHEETS_WRITE_PER_MINUTE = int(os.getenv("AMBI_SHEETS_WRITE_PER_MINUTE", "60"))
+
+    # daemonモード（--daemon）で集計する間隔（分）と、臨時の集計を受け付けるトリガーのポート
+    DAEMON_INTERVAL_MINUTES = float(os.getenv("AMBI_DAEMON_INTERVAL", "60"))
+    DAEMON_TRIGGER_PORT = int(os.getenv("AMBI_DAEMON_PORT", "8765"))
+    # トリガーの要求に必要なトークン（X-AMBI-Tokenヘッダー、空の場合はトークンを確認しない）
+    DAEMON_TRIGGER_TOKEN = os.getenv("AMBI_DAEMON_TOKEN", "")
+
+load_settings()
+ENV_FILE_LOADED = False
+
+# データ種別ごとのエンドポイント
 ENDPOINTS = {
     "platinum": "/acc_scout/platinum/",
     "regular": "/acc_scout/",
@@ -30,25 +111,188 @@ ENDPOINTS = {
 }
 COMMON_PARAMS = "PK=CA19C6"
 
+# 集計表の列（先頭のcontact_nameを除く）
+SCOUT_STATS_FIELDS = [
+    "send_count", "opens_count", "open_rate", "refusals_count", "entry_count",
+    "post_opening_entry_rate", "entry_rate", "interview_req_count", "interview_req_rate",
+]
+INTEREST_STATS_FIELDS = [
+    "interested_count", "passed_judgement_count", "passed_judgement_rate", "entry_count",
+    "entry_rate", "interview_req_count", "interview_req_rate",
+]
+
+HTTP_TIMEOUT = 30  # HTTPリクエストのタイムアウト秒数
+HTTP_POOL_SIZE = 10  # HTTPコネクションプールのサイズ
+PAGE_LOAD_TIMEOUT = 10  # 集計ページの表示を待つ最大秒数
+PAGE_LOAD_RETRIES = 1  # 集計ページの表示待機がタイムアウトした場合に読み込み直す回数
+
+# 取得と書き込みを並行する場合の、キューの上限
+PIPELINE_QUEUE_SIZE = 32
+
+# キャッシュを使わずに毎回取得する直近の日数（今日・昨日）
+CACHE_REFRESH_DAYS = 2
+
+# 期間指定で取得する場合、この日数未満の期間は日別に取得する
+RANGE_FETCH_MIN_DAYS = 7
+# 件数のある日の見積もり（estimate_active_days）が期間のこの割合を超える場合は、二分割せずに日別に取得する
+RANGE_FETCH_SPARSE_RATIO = 0.25
+
+STATE_FILE_LOCK = threading.Lock()
+
 # Google Sheets設定
 SHEET_NAME = "テスト"  # スプレッドシート名
 SERVICE_ACCOUNT_FILE = "service_account.json"  # サービスアカウントのJSONファイル
 
-def setup_driver():
+# Sheets APIの上限超過（429）・サーバーエラー（5xx）の再試行
+SHEETS_QUOTA_WINDOW = 60  # 呼び出し回数を数える期間（秒）
+SHEETS_RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHEETS_MAX_RETRIES = 6
+SHEETS_BACKOFF_BASE = 1.0  # 1回目の再試行までの待機秒数（再試行ごとに2倍にする）
+SHEETS_BACKOFF_MAX = 64.0  # 再試行までの最大待機秒数
+
+# シートの値を読み込む範囲で、書き込む行の間の空白行がこの行数以下なら1つの範囲にまとめる
+SHEET_READ_MAX_ROW_GAP = 5
+
+ACCOUNT_NAME = None  # アカウント一覧から実行している場合の、このプロセスのアカウント名
+# apply_accountがアカウントの指定で上書きする設定
+# 子プロセスは複数のアカウントに使い回されるため、最初に切り替える前の値を保存し、毎回そこから設定し直す
+ACCOUNT_SETTING_NAMES = ["SHEET_NAME", "SERVICE_ACCOUNT_FILE", "SHEET_LAYOUT_FILE", "CACHE_DB_PATH", "HISTORY_DB_PATH"]
+ACCOUNT_BASE_SETTINGS = None
+
+# シートのレイアウト（担当者ごと・スカウト種別ごとの書き込み開始行）
+DEFAULT_SHEET_LAYOUT = {
+    "山中沙矢": {"platinum": 20, "regular": 25, "interested": 30},
+    "橘萌生": {"platinum": 37, "regular": 42, "interested": 47},
+    "奥野翔子": {"platinum": 71, "regular": 76, "interested": 81},
+}
+# 開始行からの各項目の行オフセット
+METRIC_ROW_OFFSETS = {
+    "platinum": {"send_count": 0, "opens_count": 1, "entry_count": 3},
+    "regular": {"send_count": 0, "opens_count": 1, "entry_count": 3},
+    "interested": {"interested_count": 0, "entry_count": 1},
+}
+LAYOUT_INDEX = None
+
+# CSV・Parquetに出力する列（スカウトと興味ありの項目を合わせたもの）
+EXPORT_STATS_FIELDS = list(dict.fromkeys(SCOUT_STATS_FIELDS + INTEREST_STATS_FIELDS))
+EXPORT_COLUMNS = ["date", "data_type", "contact_name"] + EXPORT_STATS_FIELDS
+
+def load_env_file():
+    """
+    .envファイルの内容を環境変数に読み込み、設定値を読み直す
+    import時には読み込まず、mainから呼ばれたときに1回だけ読み込む（.envがなければ何もしない）
+    """
+    global ENV_FILE_LOADED
+    if ENV_FILE_LOADED:
+        return
+    ENV_FILE_LOADED = True
+
+    from dotenv import find_dotenv, load_dotenv
+
+    env_file = find_dotenv()
+    if env_file:
+        load_dotenv(env_file)
+        load_settings()
+
+def write_state_file(path, content, mode=0o600):
+    """
+    状態ファイルを本人だけが読める権限で書き換える（書き込み途中のファイルを残さない）
+    他のプロセスにも読ませるファイル（計測結果など）はmodeで権限を指定する
+    """
+    with STATE_FILE_LOCK:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 複数のプロセスが同じファイルを書き換えても一時ファイルが衝突しないようにする
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+def resolve_chromedriver_path(refresh=False):
+    """
+    chromedriverのパスを取得する。前回解決したパスが残っていればChromeDriverManagerを使わない
+    refresh: 前回のパスを使わずにChromeDriverManagerで解決し直す（Chromeの更新でバージョンが合わなくなった場合）
+    """
+    if not refresh and os.path.exists(DRIVER_PATH_FILE):
+        with open(DRIVER_PATH_FILE, encoding="utf-8") as f:
+            driver_path = f.read().strip()
+        if os.path.exists(driver_path):
+            return driver_path
+
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    driver_path = ChromeDriverManager().install()
+    write_state_file(DRIVER_PATH_FILE, driver_path)
+    return driver_path
+
+def load_session_cookies():
+    """
+    前回の実行で保存したログインCookieを読み込む（なければ空リスト）
+    """
+    if not os.path.exists(SESSION_COOKIE_FILE):
+        return []
+    try:
+        with open(SESSION_COOKIE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"保存済みCookieの読み込みに失敗しました: {e}")
+        return []
+
+def save_session_cookies(cookies):
+    """
+    ログインCookieを保存する（Seleniumのget_cookies()と同じ形式）
+    """
+    write_state_file(SESSION_COOKIE_FILE, json.dumps(cookies, ensure_ascii=False))
+
+def setup_driver(profile=None):
     """
     Chromeウェブドライバーを設定する
+    profileが"server"の場合は、バッチサーバー向けにヘッドレスで描画リソースを抑えた設定にする
     """
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    profile = profile or DRIVER_PROFILE
+    started_at = time.monotonic()
     chrome_options = Options()
-    chrome_options.add_argument("--start-maximized")
     chrome_options.add_argument("--disable-extensions")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    return driver
+    if profile == "server":
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1280,800")
+        # コンテナでは/dev/shmが小さいため共有メモリを使わない
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        # 集計表の取得に不要な画像・CSS・フォントを読み込まない
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.stylesheets": 2,
+            "profile.managed_default_content_settings.fonts": 2,
+        })
+        # DOMの構築が終わった時点でdriver.getから戻る
+        chrome_options.page_load_strategy = "eager"
+    else:
+        chrome_options.add_argument("--start-maximized")
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path()), options=chrome_options)
+    except SessionNotCreatedException as e:
+        # Chromeが自動更新されて保存済みのchromedriverと合わない場合は、パスを解決し直して1回だけ再試行する
+        print(f"Chromeを起動できなかったため、chromedriverを取得し直します: {e.msg}")
+        driver = webdriver.Chrome(service=Service(resolve_chromedriver_path(refresh=True)), options=chrome_options)
+    RUN_METRICS.observe("driver_startup", time.monotonic() - started_at)
+    return count_webdriver_commands(driver)
 
 def login_to_ambi(driver):
     """
     AMBIサイトにログイン
     """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
     driver.get(AMBI_LOGIN_URL)
     wait = WebDriverWait(driver, 10)
 
@@ -67,204 +311,2572 @@ def login_to_ambi(driver):
     print("AMBIサイトにログインしました。")
     return True
 
-def fetch_data_by_contact_names(driver, date, data_type, contact_names):
+def create_http_session():
     """
-    指定されたjobNameに対応するデータを取得する
+    コネクションプールとリトライを設定したrequests.Sessionを作成する
     """
-    query_params = f"?_pp_=date_from%3D{date}%7Cdate_to%3D{date}&{COMMON_PARAMS}"
-    url = f"{BASE_URL}{ENDPOINTS[data_type]}{query_params}"
-    
-    driver.get(url)
-    time.sleep(2)  # ページロード待機
-    
-    results = []
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 
-    for contact_name in contact_names:
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "Mozilla/5.0 (compatible; ambi-auto-tabulation)"
+    session.hooks["response"].append(count_http_request)
+    return session
+
+class RunMetrics:
+    """
+    1回の実行の計測値を集計する（複数スレッドから呼ばれる）
+    phases: 処理段階ごとの所要時間（回数・合計・最大, 秒）
+    counters: WebDriverコマンド・HTTPリクエスト・Sheets API呼び出しなどの回数
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+            self.counters = {}
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            summary = self.phases.setdefault(phase, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            summary["count"] += 1
+            summary["total_seconds"] += seconds
+            summary["max_seconds"] = max(summary["max_seconds"], seconds)
+
+    def increment(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        withブロックの所要時間をphaseとして記録する（例外で抜けた場合も記録する）
+        """
+        started_at = time.monotonic()
         try:
-            # jobNameに一致する行を特定
-            row = driver.find_element(By.XPATH, f"//div[@class='jobName' and text()='{contact_name}']/ancestor::tr")
-            
-            # その行に含まれるdataクラスを持つtd要素を取得
-            data_tds = row.find_elements(By.CLASS_NAME, "data")
-            
-            # 各td要素のテキストを取得
-            scout_mail_stats = [td.text for td in data_tds]
-            if(len(scout_mail_stats) == 8):
-                scout_mail_stats_dict = dict(
-                    contact_name = scout_mail_stats[0],
-                    interested_count = scout_mail_stats[1],
-                    passed_judgement_count = scout_mail_stats[2],
-                    passed_judgement_rate = scout_mail_stats[3],
-                    entry_count = scout_mail_stats[4],
-                    entry_rate = scout_mail_stats[5],
-                    interview_req_count = scout_mail_stats[6],
-                    interview_req_rate = scout_mail_stats[7],
-                )
-            else:
-                scout_mail_stats_dict = dict(
-                    contact_name = scout_mail_stats[0],
-                    send_count = scout_mail_stats[1],
-                    opens_count = scout_mail_stats[2],
-                    open_rate = scout_mail_stats[3],
-                    refusals_count = scout_mail_stats[4],
-                    entry_count = scout_mail_stats[5],
-                    post_opening_entry_rate = scout_mail_stats[6],
-                    entry_rate = scout_mail_stats[7],
-                    interview_req_count = scout_mail_stats[8],
-                    interview_req_rate = scout_mail_stats[9],
-                )
+            yield
+        finally:
+            self.observe(phase, time.monotonic() - started_at)
 
-            # 結果を保存
-            results.append({
-                "contact_name": contact_name,
-                "scout_mail_stats_dict": scout_mail_stats_dict
-            })
-            print(f"{contact_name}のデータ:{scout_mail_stats_dict}")
-        
-        except Exception as e:
-            print(f"{contact_name}のデータ取得中にエラーが発生しました: {e}")
-    
-    return results
+    def total(self, phase):
+        with self.lock:
+            return self.phases.get(phase, {}).get("total_seconds", 0.0)
 
-def get_current_month():
-    today = datetime.today()
-    current_month = f"{today.year}.{today.month:02d}"
-    toStr = str(current_month)
-    return toStr
+    def count(self, counter):
+        with self.lock:
+            return self.counters.get(counter, 0)
 
-def data_entry_position(contact_name, scout_type):
+    def snapshot(self):
+        """
+        計測値をJSONに保存できるdictで返す（各段階の平均秒数を含む）
+        """
+        with self.lock:
+            phases = {
+                phase: {
+                    **summary,
+                    "avg_seconds": summary["total_seconds"] / summary["count"] if summary["count"] else 0.0,
+                }
+                for phase, summary in sorted(self.phases.items())
+            }
+            return {"phases": phases, "counters": dict(sorted(self.counters.items()))}
+
+RUN_METRICS = RunMetrics()
+
+def count_http_request(response, *args, **kwargs):
     """
-    データを書き込む位置を取得
+    requests.Sessionのresponseフックとして、送信したHTTPリクエストの回数を数える
     """
-    if scout_type == "platinum":
-        if contact_name == "山中沙矢":
-            return 20
-        elif contact_name == "橘萌生":
-            return 37
-        elif contact_name == "奥野翔子":
-            return 71
-    elif scout_type == "regular":
-        if contact_name == "山中沙矢":
-            return 25
-        elif contact_name == "橘萌生":
-            return 42
-        elif contact_name == "奥野翔子":
-            return 76
-    elif scout_type == "interested":
-        if contact_name == "山中沙矢":
-            return 30
-        elif contact_name == "橘萌生":
-            return 47
-        elif contact_name == "奥野翔子":
-            return 81
+    RUN_METRICS.increment("http_requests")
 
+def count_webdriver_commands(driver):
+    """
+    WebDriverに送るコマンド（get, find_element, page_sourceなど）の回数を数えるようにする
+    """
+    execute = driver.execute
 
-def get_column_from_date(date_str):
+    def counted_execute(driver_command, params=None):
+        RUN_METRICS.increment("webdriver_commands")
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+    return driver
+
+def is_login_page(page_source):
     """
-    YYYY-MM-DD形式の日付を受け取り、対応する列番号（整数）を返す。
-    例: '2025-01-01' → 7 (G列), '2025-01-02' → 8 (H列)
+    ページがログインフォームかどうかを判定する（セッション切れの検出に使う）
     """
+    return 'name="accLoginID"' in page_source or "name='accLoginID'" in page_source
 
-    base_column_index = ord("G") - ord("A") + 1  # 'G'列はExcel上で7列目
-    day = int(date_str.split("-")[2])  # 日にちを取得
-    column_number = base_column_index + day - 1  # G列からスタート
-    print(f"column_number の値: {column_number}, 型: {type(column_number)}")
-    return column_number  
+def login_to_ambi_http(session):
+    """
+    ブラウザを使わずにHTTPでAMBIサイトにログインする
+    """
+    from bs4 import BeautifulSoup
 
-def write_to_google_sheets(all_scout_data):
-    # all_scout_data = [
-    #     {"2025-01-01", "platinum", "山中沙矢", {'contact_name': '山中沙矢', 'send_count': '3', 'opens_count': '0', 'open_rate': '0.0%', 'refusals_count': '0', 'entry_count': '0', 'post_opening_entry_rate': '---', 'entry_rate': '0.0%', 'interview_req_count': '0', 'interview_req_rate': '---'}},
-    #     {"2025-01-02", "regular", "橘萌生", {'contact_name': '橘萌生', 'send_count': '2', 'opens_count': '1', 'open_rate': '50.0%', 'refusals_count': '0', 'entry_count': '1', 'post_opening_entry_rate': '100.0%', 'entry_rate': '50.0%', 'interview_req_count': '1', 'interview_req_rate': '50.0%'}},
-    #     {"2025-01-03", "interested", "奥野翔子", {'contact_name': '奥野翔子', 'interested_count': '2', 'passed_judgement_count': '0', 'passed_judgement_rate': '0.0%', 'refusals_count': '0', 'entry_count': '0','entry_rate': '0.0%', 'interview_req_count': '0', 'interview_req_rate': '---'}},
-    # ]
+    response = session.get(AMBI_LOGIN_URL, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+
+    # ログインフォームのhidden項目（トークン等）も含めて送信する
+    soup = BeautifulSoup(response.text, "html.parser")
+    username_field = soup.find("input", attrs={"name": "accLoginID"})
+    form = username_field.find_parent("form") if username_field else None
+    if form is None:
+        print("ログインフォームが見つかりませんでした。")
+        return False
+
+    payload = {
+        field["name"]: field.get("value", "")
+        for field in form.find_all("input")
+        if field.get("name")
+    }
+    payload["accLoginID"] = AMBI_LOGIN_ID
+    payload["accLoginPW"] = AMBI_PASSWORD
+    action = urljoin(response.url, form.get("action") or response.url)
+
+    response = session.post(action, data=payload, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    if is_login_page(response.text):
+        print("AMBIサイトへのログインに失敗しました。")
+        return False
 
+    print("AMBIサイトにログインしました。(HTTP)")
+    return True
+
+class TokenBucket:
     """
-    データをGoogleスプレッドシートに書き込む
+    ページ取得の頻度を制限するトークンバケット（スレッドセーフ）
     """
-    # Google Sheets API認証
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    credentials = Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE,
-        scopes=scope
-    )
-    gc = gspread.authorize(credentials)
 
-    
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
 
+    def acquire(self):
+        """
+        トークンを1つ取得する。トークンがなければ補充されるまで待機する
+        戻り値: 待機した秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        started_at = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    waited = now - started_at
+                    RUN_METRICS.observe("rate_limit_wait", waited)
+                    return waited
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
 
-    # current_month_value = get_current_month()
-    # スプレッドシートを取得
-    sheet = gc.open("テスト").worksheet("シート2")
-    sheet_data = sheet.get_all_values()
-    
-    # 書き込み
-    for entry in all_scout_data:
-        print(entry)
-        date = entry["date"]
-        scout_type = entry["data_type"]
-        contact_name = entry["contact_name"]
-        scout_mail_stats_dict = entry["scout_mail_stats_dict"]
-        send_count = scout_mail_stats_dict["send_count"] if scout_type in ["platinum", "regular"] else 0 # 送信数
-        opens_count = scout_mail_stats_dict["opens_count"] if scout_type in ["platinum", "regular"] else 0 # 開封数
-        entry_count = scout_mail_stats_dict["entry_count"]
-        interested_count = scout_mail_stats_dict["interested_count"] if scout_type == "interested" else 0
-        interested_entry_count = scout_mail_stats_dict["entry_count"] if scout_type == "interested" else 0
-
-        # 該当セルにデータを書き込む
-        if scout_type in ["platinum", "regular"]:
-          # これで型を確認
-            sheet.update_cell(data_entry_position(contact_name,scout_type), get_column_from_date(date), send_count)  # 送信数
-            sheet.update_cell(data_entry_position(contact_name,scout_type) + 1, get_column_from_date(date), opens_count)   # 開封数
-            sheet.update_cell(data_entry_position(contact_name,scout_type) + 3, get_column_from_date(date), entry_count)  # エントリー数
-        elif scout_type == "interested":
-            sheet.update_cell(data_entry_position(contact_name,scout_type), get_column_from_date(date), interested_count)  # 興味あり数
-            sheet.update_cell(data_entry_position(contact_name,scout_type) + 1, get_column_from_date(date), interested_entry_count)  # エントリー数
-
-print("データの更新が完了しました！")
-
-def main():
-    driver = None
-    all_scout_data = []
+class SeleniumClient:
+    """
+    Chromeウェブドライバーでページを取得するクライアント
+    """
+
+    def __init__(self, driver, rate_limiter=None):
+        self.driver = driver
+        self.rate_limiter = rate_limiter
+
+    @classmethod
+    def create(cls, rate_limiter=None, driver_profile=None):
+        return cls(setup_driver(driver_profile), rate_limiter)
+
+    def login(self):
+        with RUN_METRICS.timer("login"):
+            logged_in = login_to_ambi(self.driver)
+        if not logged_in:
+            return False
+        save_session_cookies(self.get_cookies())
+        return True
+
+    def get_cookies(self):
+        return self.driver.get_cookies()
+
+    def restore_cookies(self, cookies):
+        """
+        保存済みCookieをブラウザに設定する（Cookieのドメインを開いてから追加する必要がある）
+        """
+        from selenium.common.exceptions import WebDriverException
+
+        self.driver.get(AMBI_LOGIN_URL)
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException:
+                pass
+
+    def get_page_source(self, url):
+        page_source = self.load_page(url)
+        # セッション切れでログイン画面が表示された場合は、ログインし直して再取得する
+        if is_login_page(page_source):
+            print("AMBIのセッションが切れているため、再ログインします。")
+            if not self.login():
+                raise RuntimeError("AMBIサイトに再ログインできませんでした。")
+            page_source = self.load_page(url)
+        return page_source
+
+    def load_page(self, url):
+        """
+        ページを開き、集計表（jobNameの行、または種類を判定できるヘッダーの表）かログインフォームが表示されるまで待機する
+        タイムアウトした場合はPAGE_LOAD_RETRIES回まで読み込み直し、それでも表示されなければStatsPageErrorを送出する
+        （読み込み途中のページを0件として扱わないため）
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        header_condition = " or ".join(f"contains(., '{keyword}')" for keyword in STATS_HEADER_KEYWORDS)
+        ready = EC.any_of(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "div.jobName")),
+            EC.presence_of_element_located((By.XPATH, f"//table[.//th[{header_condition}]]")),
+            EC.presence_of_element_located((By.NAME, "accLoginID")),
+        )
+        for attempt in range(PAGE_LOAD_RETRIES + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with RUN_METRICS.timer("page_load"):
+                self.driver.get(url)
+                # 固定時間のsleepではなく、集計表が表示されるまで待機する
+                try:
+                    WebDriverWait(self.driver, PAGE_LOAD_TIMEOUT).until(ready)
+                except TimeoutException:
+                    RUN_METRICS.increment("page_load_timeouts")
+                    if attempt == PAGE_LOAD_RETRIES:
+                        raise StatsPageError(f"ページの表示待機がタイムアウトしました: {url}")
+                    print(f"ページの表示待機がタイムアウトしたため、読み込み直します: {url}")
+                    continue
+                page_source = self.driver.page_source
+            RUN_METRICS.increment("pages")
+            return page_source
+
+    def close(self):
+        self.driver.quit()
+
+class HttpClient:
+    """
+    ログイン済みのrequests.Sessionでページを取得するクライアント
+    """
+
+    def __init__(self, session=None, rate_limiter=None):
+        self.session = session or create_http_session()
+        self.rate_limiter = rate_limiter
+
+    @classmethod
+    def create(cls, rate_limiter=None, driver_profile=None):
+        return cls(rate_limiter=rate_limiter)
+
+    def login(self):
+        with RUN_METRICS.timer("login"):
+            logged_in = login_to_ambi_http(self.session)
+        if not logged_in:
+            return False
+        save_session_cookies(self.get_cookies())
+        return True
+
+    def get_cookies(self):
+        return [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "secure": cookie.secure,
+                "expiry": cookie.expires,
+            }
+            for cookie in self.session.cookies
+        ]
+
+    def restore_cookies(self, cookies):
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+                secure=cookie.get("secure", False),
+                expires=cookie.get("expiry"),
+            )
 
+    def clone(self):
+        """
+        ログイン済みのCookieを引き継いだ別セッションのクライアントを作成する（スレッドごとに使う）
+        """
+        session = create_http_session()
+        session.cookies.update(self.session.cookies)
+        return HttpClient(session, self.rate_limiter)
+
+    def get_page_source(self, url):
+        page_source = self.load_page(url)
+        # セッション切れでログイン画面が返された場合は、ログインし直して再取得する
+        if is_login_page(page_source):
+            print("AMBIのセッションが切れているため、再ログインします。")
+            if not self.login():
+                raise RuntimeError("AMBIサイトに再ログインできませんでした。")
+            page_source = self.load_page(url)
+            if is_login_page(page_source):
+                raise RuntimeError("AMBIのセッションが切れています。")
+        return page_source
+
+    def load_page(self, url):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        with RUN_METRICS.timer("page_load"):
+            response = self.session.get(url, timeout=HTTP_TIMEOUT)
+        RUN_METRICS.increment("pages")
+        response.raise_for_status()
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+# データ取得方式ごとのクライアント（選ばれた方式のライブラリだけを読み込む）と、ログインできない場合の切り替え先
+FETCH_BACKENDS = {
+    "http": HttpClient,
+    "selenium": SeleniumClient,
+}
+FETCH_FALLBACKS = {"http": "selenium"}
+
+def is_session_valid(client):
+    """
+    今日の集計ページを1回読み込み、ログイン画面が返されないか確認する（保存済みCookieの有効性の確認）
+    確認のページの読み込みに失敗した場合（5xx・タイムアウトなど）は無効とみなし、通常のログインに進ませる
+    """
+    today = datetime.today().strftime("%Y-%m-%d")
+    try:
+        page_source = client.load_page(build_page_url(next(iter(ENDPOINTS)), today, today))
+    except Exception as e:
+        print(f"保存済みのログインセッションを確認できませんでした: {e}")
+        return False
+    return not is_login_page(page_source)
+
+def create_fetch_client(backend=None, rate_limiter=None, driver_profile=None):
+    """
+    データ取得用のクライアントを作成してログインする
+    前回のログインCookieが保存されていて、そのセッションが有効ならログインを省略する
+    ログインできない場合はFETCH_FALLBACKSの取得方式（httpの場合はSelenium）に切り替える
+    """
+    backend = backend or FETCH_BACKEND
+    saved_cookies = load_session_cookies()
+
+    client = FETCH_BACKENDS[backend].create(rate_limiter, driver_profile)
+    try:
+        if saved_cookies:
+            client.restore_cookies(saved_cookies)
+            if is_session_valid(client):
+                print(f"保存済みのログインセッションを再利用します。({backend})")
+                return client
+            # 期限切れの場合は通常どおりログインする（ログインできなければ切り替え先を使う）
+            print(f"保存済みのログインセッションが切れているため、ログインします。({backend})")
+        if client.login():
+            return client
+        error = RuntimeError("AMBIサイトにログインできませんでした。")
+    except Exception as e:
+        print(f"{backend}でのログイン中にエラーが発生しました: {e}")
+        error = e
+    client.close()
+
+    fallback = FETCH_FALLBACKS.get(backend)
+    if fallback is None:
+        raise error
+    print(f"{fallback}での取得に切り替えます。")
+    return create_fetch_client(fallback, rate_limiter, driver_profile)
+
+def create_client_pool(size=None, backend=None, rate_limiter=None, driver_profile=None):
+    """
+    ログイン済みクライアントのプールを作成する
+    HTTPは1回ログインしてCookieを共有し、Seleniumはドライバーごとに並列でログインする
+    """
+    size = size or FETCH_CONCURRENCY
+    client_pool = queue.Queue()
+    first_client = create_fetch_client(backend, rate_limiter, driver_profile)
+    client_pool.put(first_client)
+
+    if isinstance(first_client, HttpClient):
+        for _ in range(size - 1):
+            client_pool.put(first_client.clone())
+    elif size > 1:
+        # 1つでもログインに失敗した場合は、起動済みのドライバーをすべて終了してからエラーを送出する
+        error = None
+        with ThreadPoolExecutor(max_workers=size - 1) as executor:
+            futures = [
+                executor.submit(create_fetch_client, "selenium", rate_limiter, driver_profile) for _ in range(size - 1)
+            ]
+            for future in futures:
+                try:
+                    client_pool.put(future.result())
+                except Exception as e:
+                    error = error or e
+        if error:
+            close_client_pool(client_pool)
+            raise error
+    return client_pool
+
+def close_client_pool(client_pool):
+    """
+    プール内の全クライアントを終了する
+    """
+    while not client_pool.empty():
+        client_pool.get().close()
+
+def run_with_pooled_client(client_pool, func, *args):
+    """
+    プールからクライアントを借りてfuncを実行し、終わったらプールに戻す
+    """
+    client = client_pool.get()
     try:
-        # Webドライバーの設定
-        driver = setup_driver()
+        return func(client, *args)
+    finally:
+        client_pool.put(client)
+
+def build_page_url(data_type, date_from, date_to):
+    """
+    データ種別と期間から集計ページのURLを作成する
+    """
+    query_params = f"?_pp_=date_from%3D{date_from}%7Cdate_to%3D{date_to}&{COMMON_PARAMS}"
+    return f"{BASE_URL}{ENDPOINTS[data_type]}{query_params}"
+
+@dataclass(slots=True)
+class ScoutStats:
+    """
+    スカウトメール（プラチナ・通常）の1担当者分の実績
+    件数はint、率はパーセントのfloat（"---"の場合はNone）
+    """
+    contact_name: str
+    send_count: int
+    opens_count: int
+    open_rate: Optional[float]
+    refusals_count: int
+    entry_count: int
+    post_opening_entry_rate: Optional[float]
+    entry_rate: Optional[float]
+    interview_req_count: int
+    interview_req_rate: Optional[float]
+
+@dataclass(slots=True)
+class InterestStats:
+    """
+    興味ありの1担当者分の実績
+    件数はint、率はパーセントのfloat（"---"の場合はNone）
+    """
+    contact_name: str
+    interested_count: int
+    passed_judgement_count: int
+    passed_judgement_rate: Optional[float]
+    entry_count: int
+    entry_rate: Optional[float]
+    interview_req_count: int
+    interview_req_rate: Optional[float]
+
+# 集計表のヘッダーに含まれる文言から、行の種類を判定する
+STATS_HEADER_KEYWORDS = {
+    "興味": InterestStats,
+    "送信": ScoutStats,
+}
+STATS_RECORD_TYPES = {"scout": ScoutStats, "interest": InterestStats}
+
+class StatsPageError(RuntimeError):
+    """
+    取得したページに集計表がない（メンテナンス中・エラーページ・読み込み途中など）
+    0件の日と区別するため、解析結果を空にせずに送出する
+    """
+
+def parse_count(text):
+    """
+    件数のテキスト（"1,234"など）を整数にする
+    """
+    value = text.replace(",", "").strip()
+    if value in ("", "---"):
+        return 0
+    return int(value)
+
+def parse_rate(text):
+    """
+    率のテキスト（"50.0%"など）をパーセントのfloatにする。"---"はNone
+    """
+    value = text.replace("%", "").strip()
+    if value in ("", "---"):
+        return None
+    return float(value)
+
+def get_record_class_from_headers(headers):
+    """
+    ヘッダーの文言から行の種類（ScoutStats/InterestStats）を判定する（判定できなければNone）
+    """
+    for keyword, record_class in STATS_HEADER_KEYWORDS.items():
+        if any(keyword in header for header in headers):
+            return record_class
+    return None
+
+def build_stats_record(scout_mail_stats, record_class=None):
+    """
+    1行分のdataセルのテキストから実績のレコードを作成する
+    ヘッダーから種類が判定できない場合は、列数から判定する
+    """
+    if record_class is None:
+        record_class = InterestStats if len(scout_mail_stats) == 8 else ScoutStats
+    stats_fields = fields(record_class)
+    if len(scout_mail_stats) != len(stats_fields):
+        raise ValueError(
+            f"{record_class.__name__}の列数が一致しません（期待値: {len(stats_fields)}, 実際: {len(scout_mail_stats)}）"
+        )
+
+    values = [scout_mail_stats[0]]
+    for field, text in zip(stats_fields[1:], scout_mail_stats[1:]):
+        values.append(parse_count(text) if field.name.endswith("_count") else parse_rate(text))
+    return record_class(*values)
+
+def stats_to_dict(record):
+    """
+    レコードをキャッシュ・チェックポイントに保存できるdictにする
+    """
+    record_type = "interest" if isinstance(record, InterestStats) else "scout"
+    return {"record_type": record_type, **asdict(record)}
+
+def stats_from_dict(data):
+    """
+    stats_to_dictで保存したdictからレコードを復元する
+    """
+    data = dict(data)
+    record_class = STATS_RECORD_TYPES[data.pop("record_type")]
+    return record_class(**data)
+
+def parse_stats_page(page_source):
+    """
+    ページのHTMLを1回だけ走査し、全jobName行の実績レコードを取得する
+    ヘッダーから種類を判定できる集計表がない場合はStatsPageErrorを送出する（担当者が0人の集計表は空のリストを返す）
+    """
+    from bs4 import BeautifulSoup
 
-        # AMBIにログイン
-        if not login_to_ambi(driver):
+    started_at = time.monotonic()
+    soup = BeautifulSoup(page_source, "html.parser")
+    if not any(
+        get_record_class_from_headers([th.get_text(strip=True) for th in table.select("th")])
+        for table in soup.select("table")
+    ):
+        title = soup.title.get_text(strip=True) if soup.title else ""
+        raise StatsPageError(f"集計表のないページが返されました: {title or '(タイトルなし)'}")
+    results = []
+    record_class_by_table = {}
+
+    for job_name in soup.select("div.jobName"):
+        contact_name = job_name.get_text(strip=True)
+        try:
+            # jobNameを含む行の、dataクラスを持つ要素のテキストを取得
+            row = job_name.find_parent("tr")
+            table = row.find_parent("table")
+            if id(table) not in record_class_by_table:
+                headers = [th.get_text(strip=True) for th in table.select("th")] if table else []
+                record_class_by_table[id(table)] = get_record_class_from_headers(headers)
+            scout_mail_stats = [td.get_text(strip=True) for td in row.select(".data")]
+            record = build_stats_record(scout_mail_stats, record_class_by_table[id(table)])
+        except Exception as e:
+            print(f"{contact_name}のデータ解析中にエラーが発生しました: {e}")
+            RUN_METRICS.increment("parse_errors")
+            continue
+
+        results.append(record)
+    RUN_METRICS.observe("parse", time.monotonic() - started_at)
+    return results
+
+def fetch_data_by_contact_names(client, date, data_type, contact_names=None):
+    """
+    指定されたjobNameに対応するデータを取得する
+    page_sourceを1回だけ取得して全行をまとめて解析する。contact_namesがNoneの場合は全担当者分を返す
+    """
+    url = build_page_url(data_type, date, date)
+    all_results = parse_stats_page(client.get_page_source(url))
+    if contact_names is None:
+        return all_results
+
+    results_by_name = {record.contact_name: record for record in all_results}
+    results = []
+    for contact_name in contact_names:
+        if contact_name not in results_by_name:
+            print(f"{contact_name}のデータが見つかりませんでした")
+            continue
+        results.append(results_by_name[contact_name])
+        print(f"{contact_name}のデータ:{results_by_name[contact_name]}")
+
+    return results
+
+def filter_contacts(all_results, contact_names):
+    """
+    解析結果から指定されたjobNameのデータだけを取り出す（contact_namesがNoneの場合は全件）
+    """
+    if contact_names is None:
+        return all_results
+    return [record for record in all_results if record.contact_name in contact_names]
+
+def get_stats_counts(record):
+    """
+    実績のうち件数（*_count）の項目だけを取り出す
+    """
+    return {
+        field.name: getattr(record, field.name)
+        for field in fields(record)
+        if field.name.endswith("_count")
+    }
+
+def build_zero_stats(record):
+    """
+    件数が0件の日の実績を作成する（率は分母が0のためNone）
+    """
+    values = {}
+    for field in fields(record):
+        if field.name == "contact_name":
+            values[field.name] = record.contact_name
+        elif field.name.endswith("_count"):
+            values[field.name] = 0
+        else:
+            values[field.name] = None
+    return type(record)(**values)
+
+def estimate_active_days(totals_counts):
+    """
+    期間の件数の合計から、件数のある日数を多めに見積もる（担当者ごとの最も多い件数の合計）
+    件数のある日は送信数・興味あり数などが1以上になるため、通常は件数のある日数を下回らない。
+    見積もりが外れても取得ページ数が変わるだけで、結果は変わらない
+    """
+    return sum(max(list(counts.values()) + [0]) for counts in totals_counts.values())
+
+def plan_range_fetch(client, data_type, dates, contact_names=None):
+    """
+    期間指定（_pp_のdate_from/date_to）の合計値から、日別ページの取得が必要な日を絞り込む
+    AMBIの期間ページは合計値しか返さないため、合計が0件の期間はまとめて0件とする。
+    件数が少なく、件数のある日が期間のRANGE_FETCH_SPARSE_RATIO以下と見積もられる期間だけを二分割していき、
+    それ以外の期間はそのまま日別に取得する（日別取得に加えて、期間ごとに1ページの合計値の取得が増える）
+    戻り値: (0件と確定した日の結果 {date: results}, 日別に取得が必要な日のリスト)
+    """
+    per_day_results = {}
+    days_to_fetch = []
+
+    def fill_zero(days, totals):
+        for date in days:
+            per_day_results[date] = [build_zero_stats(record) for record in totals]
+
+    def fetch_totals(days):
+        url = build_page_url(data_type, days[0], days[-1])
+        return filter_contacts(parse_stats_page(client.get_page_source(url)), contact_names)
+
+    def split(days, totals, totals_counts):
+        # 期間内に件数のある担当者がいなければ、全日0件
+        active_days = estimate_active_days(totals_counts)
+        if active_days == 0:
+            fill_zero(days, totals)
+            return
+        # 短い期間と、件数のある日が多いかもしれない期間は、分割しても取得ページ数が減らないため日別に取得する
+        if len(days) < RANGE_FETCH_MIN_DAYS or active_days > len(days) * RANGE_FETCH_SPARSE_RATIO:
+            days_to_fetch.extend(days)
             return
 
-        # データ収集
-        today = datetime.today()
-        start_date = today - timedelta(days=3)  # 過去7日分
-        # 指定するjobNameのリスト
-        contact_names = ["山中沙矢", "橘萌生", "奥野翔子"]
-
-        for single_date in (start_date + timedelta(n) for n in range(3)):
-            formatted_date = single_date.strftime("%Y-%m-%d")
-            print(f"\n{formatted_date}のデータ収集を開始:")
-
-            for data_type in ENDPOINTS.keys():
-                data = fetch_data_by_contact_names(driver, formatted_date, data_type, contact_names)
-                
-                for entry in data:
-                    all_scout_data.append({
-                        "date": formatted_date,
-                        "data_type": data_type,
-                        "contact_name": entry["contact_name"],
-                        "scout_mail_stats_dict": entry["scout_mail_stats_dict"]
-                    })
-
-                time.sleep(1)
-        # データをGoogleスプレッドシートに書き込む
-        print(all_scout_data)
-        write_to_google_sheets(all_scout_data)
+        middle = len(days) // 2
+        left_days, right_days = days[:middle], days[middle:]
+        left_totals = fetch_totals(left_days)
+        left_counts = {
+            record.contact_name: get_stats_counts(record)
+            for record in left_totals
+        }
+        # 後半の件数は期間合計から前半を引いて求める
+        right_counts = {
+            contact_name: {
+                key: value - left_counts.get(contact_name, {}).get(key, 0)
+                for key, value in counts.items()
+            }
+            for contact_name, counts in totals_counts.items()
+        }
+        split(left_days, left_totals, left_counts)
+        split(right_days, totals, right_counts)
 
-    except Exception as e:
-        print(f"スクリプト実行中に致命的なエラーが発生しました: {e}")
+    if not RANGE_FETCH or len(dates) < RANGE_FETCH_MIN_DAYS:
+        return per_day_results, list(dates)
+
+    totals = fetch_totals(dates)
+    totals_counts = {
+        record.contact_name: get_stats_counts(record)
+        for record in totals
+    }
+    split(dates, totals, totals_counts)
+    return per_day_results, days_to_fetch
+
+def fetch_range_by_contact_names(client, data_type, dates, contact_names=None):
+    """
+    期間指定で取得し、日別の結果 {date: results} に分割する
+    """
+    per_day_results, days_to_fetch = plan_range_fetch(client, data_type, dates, contact_names)
+    for date in days_to_fetch:
+        per_day_results[date] = fetch_data_by_contact_names(client, date, data_type, contact_names)
+    return per_day_results
+
+def split_contiguous_dates(dates):
+    """
+    YYYY-MM-DD形式の日付リストを、連続した日付ごとのまとまりに分ける
+    """
+    runs = []
+    previous = None
+    for date in sorted(dates):
+        current = datetime.strptime(date, "%Y-%m-%d")
+        if previous is not None and current - previous == timedelta(days=1):
+            runs[-1].append(date)
+        else:
+            runs.append([date])
+        previous = current
+    return runs
+
+def iter_fetch_concurrently(client_pool, tasks, contact_names=None, max_workers=None):
+    """
+    (date, data_type)の組を上限付きのワーカーで並列に取得し、取得できた順に
+    ((date, data_type), results) を返すジェネレーター
+    """
+    max_workers = max_workers or FETCH_CONCURRENCY
+    dates_by_type = {}
+    for date, data_type in tasks:
+        dates_by_type.setdefault(data_type, []).append(date)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    first_error = None
+    try:
+        # 連続した期間の合計値から、データ種別ごとに日別取得が必要な日を絞り込む
+        pending = {
+            executor.submit(run_with_pooled_client, client_pool, plan_range_fetch, data_type, dates, contact_names): ("plan", data_type)
+            for data_type, type_dates in dates_by_type.items()
+            for dates in split_contiguous_dates(type_dates)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                # 一部のページで失敗しても残りの取得は続け、最後にエラーを送出する
+                if future.exception() is not None:
+                    print(f"{key}のデータ取得中にエラーが発生しました: {future.exception()}")
+                    first_error = first_error or future.exception()
+                    continue
+                if kind == "fetch":
+                    yield key, future.result()
+                    continue
+
+                per_day_results, days_to_fetch = future.result()
+                for date in days_to_fetch:
+                    fetch_future = executor.submit(
+                        run_with_pooled_client, client_pool, fetch_data_by_contact_names, date, key, contact_names
+                    )
+                    pending[fetch_future] = ("fetch", (date, key))
+                for date, day_results in per_day_results.items():
+                    yield (date, key), day_results
+        if first_error:
+            raise first_error
     finally:
-        if driver:
-            driver.quit()
+        # 途中で失敗した場合は、まだ始まっていない取得を取り消す
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def fetch_all_concurrently(client_pool, tasks, contact_names=None, max_workers=None):
+    """
+    (date, data_type)の組を上限付きのワーカーで並列に取得する
+    戻り値: {(date, data_type): results}
+    """
+    return dict(iter_fetch_concurrently(client_pool, tasks, contact_names, max_workers))
+
+def build_scout_entries(results, dates, data_types, contact_names):
+    """
+    取得結果を日付・データ種別の順に並べ、指定された担当者のデータだけをall_scout_dataの形式にする
+    """
+    all_scout_data = []
+    for formatted_date in dates:
+        for data_type in data_types:
+            for record in filter_contacts(results[(formatted_date, data_type)], contact_names):
+                all_scout_data.append({
+                    "date": formatted_date,
+                    "data_type": data_type,
+                    "contact_name": record.contact_name,
+                    "stats": record
+                })
+    return all_scout_data
+
+class RunCheckpoint:
+    """
+    実行の進捗（取得済み・書き込み済みの(date, data_type)）を記録するチェックポイント
+    --resumeで再実行すると、前回止まったところから取得・書き込みを再開する
+    options: 実行時の指定（build_checkpoint_options）。再開時に今回の指定と一致するかを確認する
+    ファイルは1行目に対象のtasks・options、以降に取得・書き込みのたびに1行ずつ追記するJSON Lines形式
+    （長い期間でも、1ページごとにファイル全体を書き直さない）
+    """
+
+    def __init__(self, path, tasks, options=None, fetched=None, written=None):
+        self.path = path
+        self.tasks = [tuple(task) for task in tasks]
+        self.options = options
+        self.fetched = fetched or {}  # "date|data_type" → stats_to_dictで保存した結果
+        self.written = set(written or [])  # 書き込み済みの"date|data_type"
+
+    @staticmethod
+    def make_key(date, data_type):
+        return f"{date}|{data_type}"
+
+    @classmethod
+    def start(cls, path, tasks, options):
+        checkpoint = cls(path, tasks, options)
+        write_state_file(path, json.dumps({"tasks": checkpoint.tasks, "options": options}, ensure_ascii=False) + "\n")
+        return checkpoint
+
+    @classmethod
+    def load(cls, path):
+        """
+        保存されたチェックポイントを読み込む（なければNone）
+        途中で止まって最後の行が書きかけの場合は、その行を読み飛ばす
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0])
+        checkpoint = cls(path, header["tasks"], header.get("options"))
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "fetched" in entry:
+                checkpoint.fetched[entry["fetched"]] = entry["results"]
+            else:
+                checkpoint.written.update(entry["written"])
+        return checkpoint
+
+    def append(self, entry):
+        with STATE_FILE_LOCK:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def find_mismatched_options(self, options):
+        """
+        今回の指定と異なる項目名のリストを返す（指定を記録していない古いチェックポイントは全項目が異なるとみなす）
+        """
+        saved = self.options or {}
+        return [name for name, value in options.items() if saved.get(name) != value]
+
+    def fetched_results(self):
+        """
+        取得済みの結果を {(date, data_type): results} の形式で返す
+        """
+        return {
+            tuple(key.split("|")): [stats_from_dict(data) for data in day_results]
+            for key, day_results in self.fetched.items()
+        }
+
+    def unwritten_tasks(self):
+        return [task for task in self.tasks if self.make_key(*task) not in self.written]
+
+    def record_fetched(self, date, data_type, day_results):
+        key = self.make_key(date, data_type)
+        self.fetched[key] = [stats_to_dict(record) for record in day_results]
+        self.append({"fetched": key, "results": self.fetched[key]})
+
+    def record_written(self, dates, data_types):
+        keys = [self.make_key(date, data_type) for date in dates for data_type in data_types]
+        self.written.update(keys)
+        self.append({"written": keys})
+
+    def complete(self):
+        """
+        全件の書き込みが終わったらチェックポイントを削除する
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def build_checkpoint_options(args):
+    """
+    チェックポイントに記録する実行時の指定（期間・データ種別・担当者・出力先）
+    出力先が異なる実行に、前回の書き込み済みの記録を当てはめないために使う
+    """
+    return {
+        "date_from": args.date_from,
+        "date_to": args.date_to,
+        "data_types": list(args.data_types),
+        "contacts": list(args.contacts) if args.contacts else None,
+        "output": args.output,
+        "output_path": None if args.output == "sheets" else get_output_path(args.output, args.output_path),
+    }
+
+def run_sync_pipeline(client_pool, tasks, results, contact_names, writer, cache=None, batch_days=None, checkpoint=None, max_workers=None, history=None):
+    """
+    取得と書き込みを並行して行う
+    取得スレッドが結果を上限付きのキューに入れ、全データ種別がそろった日をbatch_days日分ずつ書き込む。
+    途中のページで失敗しても、それまでにそろった日は書き込んでからエラーを送出する
+    results: 取得済み（キャッシュ等）の {(date, data_type): results}。取得した結果もここに追加する
+    checkpoint: 指定された場合、取得・書き込みの進捗を記録する
+    history: 指定された場合、取得した実績を履歴DBに追加する
+    """
+    batch_days = batch_days or WRITE_BATCH_DAYS
+    dates = sorted({date for date, _ in tasks})
+    data_types = list(dict.fromkeys(data_type for _, data_type in tasks))
+    remaining_by_date = {date: 0 for date in dates}
+    for date, data_type in tasks:
+        if (date, data_type) not in results:
+            remaining_by_date[date] += 1
+    pending_tasks = [task for task in tasks if task not in results]
+
+    result_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop_event = threading.Event()
+    done_marker = object()
+
+    def put(item):
+        # 書き込み側が失敗して止まった場合は、キューが空くのを待たずに終了する
+        while not stop_event.is_set():
+            try:
+                result_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for key, day_results in iter_fetch_concurrently(client_pool, pending_tasks, max_workers=max_workers):
+                if not put((key, day_results)):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done_marker)
+
+    def flush(ready_dates):
+        if not ready_dates:
+            return
+        dates_to_write = sorted(ready_dates)
+        writer.write(build_scout_entries(results, dates_to_write, data_types, contact_names))
+        if checkpoint and not getattr(writer, "writes_on_close", False):
+            checkpoint.record_written(dates_to_write, data_types)
+        print(f"{dates_to_write[0]}〜{dates_to_write[-1]}の{len(dates_to_write)}日分を書き込みました。")
+        ready_dates.clear()
+
+    # Sheetsの上限に達して待機が必要な間は書き込まず、そろった日を次の書き込みにまとめる
+    can_write_now = getattr(writer, "can_write_now", None)
+    ready_dates = [date for date in dates if remaining_by_date[date] == 0]
+    error = None
+    if pending_tasks:
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = result_queue.get()
+                if item is done_marker:
+                    break
+                if isinstance(item, Exception):
+                    error = item
+                    continue
+
+                (date, data_type), day_results = item
+                results[(date, data_type)] = day_results
+                if cache:
+                    save_cached_results(cache, {(date, data_type): day_results})
+                if checkpoint:
+                    checkpoint.record_fetched(date, data_type, day_results)
+                if history:
+                    append_history(history, date, data_type, day_results)
+                remaining_by_date[date] -= 1
+                if remaining_by_date[date] == 0:
+                    ready_dates.append(date)
+                if len(ready_dates) >= batch_days and (can_write_now is None or can_write_now()):
+                    flush(ready_dates)
+        finally:
+            stop_event.set()
+            producer.join()
+
+    flush(ready_dates)
+    if error:
+        raise error
+    return results
+
+def open_stats_cache(path=None):
+    """
+    取得済みページの解析結果を保存するSQLiteキャッシュを開く
+    """
+    conn = sqlite3.connect(path or CACHE_DB_PATH)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS page_stats (
+            data_type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            results TEXT NOT NULL,
+            fetched_at TEXT NOT NULL,
+            PRIMARY KEY (data_type, date)
+        )
+        """
+    )
+    return conn
+
+def is_cacheable_date(date, today=None):
+    """
+    キャッシュを使ってよい日付か判定する（今日・昨日はまだ数値が変わるため毎回取得する）
+    """
+    today = today or datetime.today()
+    refresh_from = (today - timedelta(days=CACHE_REFRESH_DAYS - 1)).strftime("%Y-%m-%d")
+    return date < refresh_from
+
+def load_cached_results(conn, tasks, force_refresh=None, today=None):
+    """
+    キャッシュから(date, data_type)の結果を読み込む
+    戻り値: {(date, data_type): results}（キャッシュを使えない組は含まない）
+    """
+    if force_refresh is None:
+        force_refresh = CACHE_FORCE_REFRESH
+    if force_refresh:
+        return {}
+    cached = {}
+    for date, data_type in tasks:
+        if not is_cacheable_date(date, today):
+            continue
+        row = conn.execute(
+            "SELECT results FROM page_stats WHERE data_type = ? AND date = ?",
+            (data_type, date),
+        ).fetchone()
+        if not row:
+            continue
+        try:
+            day_results = [stats_from_dict(data) for data in json.loads(row[0])]
+        except (KeyError, TypeError):
+            # 以前の形式で保存されたデータは取得し直す
+            continue
+        # 担当者が1人もいない結果は、集計表のないページから保存された可能性があるため取得し直す
+        if day_results:
+            cached[(date, data_type)] = day_results
+    return cached
+
+def save_cached_results(conn, results):
+    """
+    取得した(date, data_type)の結果をキャッシュに保存する（担当者が1人もいない結果は保存しない）
+    """
+    fetched_at = datetime.now().isoformat(timespec="seconds")
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO page_stats (data_type, date, results, fetched_at) VALUES (?, ?, ?, ?)",
+            [
+                (data_type, date, json.dumps([stats_to_dict(record) for record in day_results], ensure_ascii=False), fetched_at)
+                for (date, data_type), day_results in results.items()
+                if day_results
+            ],
+        )
+
+def open_history_store(path=None):
+    """
+    実績の履歴DBを開く（項目ごとの列を持つテーブル）
+    """
+    conn = sqlite3.connect(path or HISTORY_DB_PATH)
+    count_columns = [field for field in EXPORT_STATS_FIELDS if field.endswith("_count")]
+    column_definitions = ", ".join(
+        f"{field} {'INTEGER' if field in count_columns else 'REAL'}" for field in EXPORT_STATS_FIELDS
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS history (
+            date TEXT NOT NULL,
+            data_type TEXT NOT NULL,
+            contact_name TEXT NOT NULL,
+            {column_definitions},
+            PRIMARY KEY (date, data_type, contact_name)
+        )
+        """
+    )
+    return conn
+
+def append_history(conn, date, data_type, records):
+    """
+    取得した実績を履歴DBに追加する（同じ日付・データ種別・担当者は最新の値で置き換える）
+    """
+    columns = EXPORT_COLUMNS
+    placeholders = ", ".join("?" for _ in columns)
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO history ({', '.join(columns)}) VALUES ({placeholders})",
+            [
+                [date, data_type, record.contact_name]
+                + [getattr(record, field, None) for field in EXPORT_STATS_FIELDS]
+                for record in records
+            ],
+        )
+
+def load_history(conn, date_from=None, date_to=None, data_types=None, contact_names=None):
+    """
+    履歴DBから条件に合う実績をDataFrameで読み込む
+    """
+    import pandas as pd
+
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append("date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("date <= ?")
+        params.append(date_to)
+    for column, values in (("data_type", data_types), ("contact_name", contact_names)):
+        if values:
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    history = pd.read_sql_query(f"SELECT * FROM history {where}", conn, params=params)
+    history["date"] = pd.to_datetime(history["date"])
+    return history
+
+# 集計時に件数の合計から計算し直す率（AMBIの集計表の1行と同じ定義, 単位: %）
+# 率の項目 → (分子, スカウトの分母, 興味ありの分母)。分母がNoneのデータ種別にはその率がない
+HISTORY_RATE_DEFINITIONS = {
+    "open_rate": ("opens_count", "send_count", None),  # 開封率 = 開封数 / 送信数
+    "post_opening_entry_rate": ("entry_count", "opens_count", None),  # 開封後応募率 = 応募数 / 開封数
+    "passed_judgement_rate": ("passed_judgement_count", None, "interested_count"),  # 審査通過率 = 審査通過数 / 興味あり数
+    "entry_rate": ("entry_count", "send_count", "interested_count"),  # 応募率 = 応募数 / 送信数（興味あり数）
+    "interview_req_rate": ("interview_req_count", "entry_count", "entry_count"),  # 面接依頼率 = 面接依頼数 / 応募数
+}
+
+def aggregate_history(conn, freq="M", date_from=None, date_to=None, data_types=None, contact_names=None):
+    """
+    履歴DBの実績を期間（freq: "D"=日, "W"=週, "M"=月, "Q"=四半期, "Y"=年）ごとに集計する
+    件数を合計してから、率をHISTORY_RATE_DEFINITIONSの分母でまとめて計算する（単位: %）
+    分母が0の場合と、そのデータ種別にない率はNaN
+    """
+    import numpy as np
+
+    history = load_history(conn, date_from, date_to, data_types, contact_names)
+    count_columns = [field for field in EXPORT_STATS_FIELDS if field.endswith("_count")]
+    history["period"] = history["date"].dt.to_period(freq)
+
+    totals = (
+        history.groupby(["period", "data_type", "contact_name"])[count_columns]
+        .sum(min_count=1)
+        .reset_index()
+    )
+    counts = {column: totals[column].to_numpy(dtype=float) for column in count_columns}
+    is_interested = totals["data_type"].to_numpy() == "interested"
+    no_base = np.full(len(totals), np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for rate, (numerator, scout_base, interested_base) in HISTORY_RATE_DEFINITIONS.items():
+            base = np.where(
+                is_interested,
+                counts[interested_base] if interested_base else no_base,
+                counts[scout_base] if scout_base else no_base,
+            )
+            totals[rate] = np.where(base > 0, counts[numerator] / base * 100, np.nan)
+    return totals
+
+def get_month_sheet_name(date_str):
+    """
+    YYYY-MM-DD形式の日付から、書き込み先の月のワークシート名（YYYY.MM）を返す
+    """
+    year, month, _ = date_str.split("-")
+    return f"{year}.{month}"
+
+def get_current_month():
+    return get_month_sheet_name(datetime.today().strftime("%Y-%m-%d"))
+
+def load_sheet_layout(path=None):
+    """
+    担当者・スカウト種別ごとの書き込み開始行を読み込む
+    JSONファイル（AMBI_SHEET_LAYOUT）があればその内容を、なければDEFAULT_SHEET_LAYOUTを使う
+    """
+    path = path or SHEET_LAYOUT_FILE
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_SHEET_LAYOUT
+
+def build_layout_index(layout):
+    """
+    レイアウトから (contact_name, scout_type, metric) → 行番号 の索引を作成する
+    """
+    layout_index = {}
+    for contact_name, base_rows in layout.items():
+        for scout_type, base_row in base_rows.items():
+            for metric, offset in METRIC_ROW_OFFSETS[scout_type].items():
+                layout_index[(contact_name, scout_type, metric)] = base_row + offset
+    return layout_index
+
+def get_layout_index():
+    """
+    行番号の索引を取得する（レイアウトは実行中に1回だけ読み込む）
+    """
+    global LAYOUT_INDEX
+    if LAYOUT_INDEX is None:
+        LAYOUT_INDEX = build_layout_index(load_sheet_layout())
+    return LAYOUT_INDEX
+
+def get_layout_contact_names():
+    """
+    レイアウトに登録されている担当者名の一覧を取得する
+    """
+    contact_names = []
+    for contact_name, _, _ in get_layout_index():
+        if contact_name not in contact_names:
+            contact_names.append(contact_name)
+    return contact_names
+
+def data_entry_position(contact_name, scout_type):
+    """
+    データを書き込む位置を取得
+    """
+    first_metric = next(iter(METRIC_ROW_OFFSETS[scout_type]))
+    return get_layout_index().get((contact_name, scout_type, first_metric))
+
+def get_column_from_date(date_str):
+    """
+    YYYY-MM-DD形式の日付を受け取り、対応する列番号（整数）を返す。
+    例: '2025-01-01' → 7 (G列), '2025-01-02' → 8 (H列)
+    """
+
+    base_column_index = ord("G") - ord("A") + 1  # 'G'列はExcel上で7列目
+    day = int(date_str.split("-")[2])  # 日にちを取得
+    column_number = base_column_index + day - 1  # G列からスタート
+    print(f"column_number の値: {column_number}, 型: {type(column_number)}")
+    return column_number  
+
+def build_sheet_updates(all_scout_data):
+    """
+    all_scout_dataから書き込むセルの一覧 (row, column, value) をメモリ上で組み立てる
+    """
+    layout_index = get_layout_index()
+    updates = []
+    unknown_contacts = set()
+    for entry in all_scout_data:
+        scout_type = entry["data_type"]
+        contact_name = entry["contact_name"]
+        record = entry["stats"]
+        column = get_column_from_date(entry["date"])
+
+        # 送信数・開封数・エントリー数（興味ありの場合は興味あり数・エントリー数）を書き込む
+        for metric in METRIC_ROW_OFFSETS[scout_type]:
+            row = layout_index.get((contact_name, scout_type, metric))
+            if row is None:
+                unknown_contacts.add(contact_name)
+                continue
+            updates.append((row, column, getattr(record, metric)))
+
+    if unknown_contacts:
+        print(f"書き込み位置が登録されていない担当者をスキップしました: {', '.join(sorted(unknown_contacts))}")
+    return updates
+
+def normalize_cell_value(value):
+    """
+    比較用にセルの値を正規化する（表示形式の桁区切りや前後の空白を無視する）
+    """
+    return str(value).replace(",", "").strip()
+
+def diff_sheet_updates(updates, sheet_data):
+    """
+    書き込み予定のセルのうち、シートの現在値と異なるものだけを返す
+    戻り値: (変更があるセルのリスト, 変更がないセルの数)
+    """
+    changed = []
+    unchanged_count = 0
+    for row, column, value in updates:
+        current_value = ""
+        if row <= len(sheet_data) and column <= len(sheet_data[row - 1]):
+            current_value = sheet_data[row - 1][column - 1]
+        if normalize_cell_value(current_value) == normalize_cell_value(value):
+            unchanged_count += 1
+        else:
+            changed.append((row, column, value))
+    return changed, unchanged_count
+
+def apply_updates_to_sheet_data(sheet_data, updates):
+    """
+    書き込んだ値を読み込み済みのシートの値にも反映する（同じ実行中の次の差分計算に使う）
+    """
+    for row, column, value in updates:
+        while len(sheet_data) < row:
+            sheet_data.append([])
+        cells = sheet_data[row - 1]
+        while len(cells) < column:
+            cells.append("")
+        cells[column - 1] = str(value)
+
+def group_rows(rows, max_gap=SHEET_READ_MAX_ROW_GAP):
+    """
+    行番号を、間の空白行がmax_gap行以下のものどうしでまとめる
+    戻り値: [(開始行, 終了行), ...]
+    """
+    groups = []
+    for row in sorted(set(rows)):
+        if groups and row - groups[-1][1] - 1 <= max_gap:
+            groups[-1][1] = row
+        else:
+            groups.append([row, row])
+    return [tuple(group) for group in groups]
+
+def build_month_read_ranges(sheet_name):
+    """
+    月のワークシートで書き込み先になりうるセル（レイアウトの全行 × その月の全日付の列）を囲むA1形式の範囲を作る
+    """
+    from gspread.utils import rowcol_to_a1
+
+    year, month = (int(part) for part in sheet_name.split("."))
+    first_column = get_column_from_date(f"{year:04d}-{month:02d}-01")
+    last_column = first_column + calendar.monthrange(year, month)[1] - 1
+    return [
+        f"{rowcol_to_a1(start_row, first_column)}:{rowcol_to_a1(end_row, last_column)}"
+        for start_row, end_row in group_rows(get_layout_index().values())
+    ]
+
+def build_sheet_data_from_ranges(ranges, value_ranges):
+    """
+    batch_getで読み込んだ範囲ごとの値を、シート全体と同じ行・列番号で参照できるsheet_dataにする（範囲外は空）
+    """
+    from gspread.utils import a1_to_rowcol
+
+    sheet_data = []
+    for a1_range, values in zip(ranges, value_ranges):
+        start_row, start_column = a1_to_rowcol(a1_range.split(":")[0])
+        apply_updates_to_sheet_data(sheet_data, [
+            (start_row + row_offset, start_column + column_offset, value)
+            for row_offset, row_values in enumerate(values)
+            for column_offset, value in enumerate(row_values)
+        ])
+    return sheet_data
+
+class SheetsQuotaController:
+    """
+    Sheets APIの呼び出しを、1分あたりの上限（読み込み・書き込み別）に収まるように間隔を空けて行う（スレッドセーフ）
+    429・5xxのエラーはジッター付きの指数バックオフで再試行する。
+    429が返った場合は他の利用者と上限を分け合っているとみなして上限を半分に下げ、成功するごとに1回ずつ戻す
+    """
+
+    def __init__(self, read_per_minute=None, write_per_minute=None, window=SHEETS_QUOTA_WINDOW,
+                 max_retries=SHEETS_MAX_RETRIES, backoff_base=SHEETS_BACKOFF_BASE):
+        self.max_limits = {
+            "read": read_per_minute or SHEETS_READ_PER_MINUTE,
+            "write": write_per_minute or SHEETS_WRITE_PER_MINUTE,
+        }
+        self.limits = dict(self.max_limits)
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.calls = {kind: deque() for kind in self.limits}  # 種別ごとの直近の呼び出し時刻
+        self.blocked_until = 0.0  # バックオフ中は、この時刻まで呼び出さない
+        self.lock = threading.Lock()
+
+    def get_wait_seconds(self, kind, now):
+        """
+        kindの呼び出しを今行う場合に待つ秒数（lockを取得した状態で呼ぶ）
+        """
+        calls = self.calls[kind]
+        while calls and calls[0] <= now - self.window:
+            calls.popleft()
+        wait_seconds = self.blocked_until - now
+        if len(calls) >= int(self.limits[kind]):
+            wait_seconds = max(wait_seconds, calls[0] + self.window - now)
+        return max(wait_seconds, 0.0)
+
+    def can_call(self, kind):
+        """
+        待たずにkindの呼び出しができるかどうか
+        """
+        with self.lock:
+            return self.get_wait_seconds(kind, time.monotonic()) == 0
+
+    def acquire(self, kind):
+        """
+        上限・バックオフに従って待機し、呼び出しを1回分記録する
+        戻り値: 待機した秒数
+        """
+        started_at = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait_seconds = self.get_wait_seconds(kind, now)
+                if wait_seconds == 0:
+                    self.calls[kind].append(now)
+                    break
+            time.sleep(wait_seconds)
+        waited = now - started_at
+        if waited:
+            RUN_METRICS.observe("quota_wait", waited)
+        return waited
+
+    def backoff(self, kind, attempt, status):
+        """
+        attempt回目の失敗後の待機時間を決め、その間は全ての呼び出しを止める
+        """
+        delay = min(self.backoff_base * (2 ** attempt + random.random()), SHEETS_BACKOFF_MAX)
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            if status == 429:
+                self.limits[kind] = max(1, self.limits[kind] / 2)
+        RUN_METRICS.increment("sheets_retries")
+        return delay
+
+    def call(self, kind, func, *args, **kwargs):
+        """
+        kind（"read" または "write"）の上限に従ってfuncを呼び出し、429・5xxの場合は再試行する
+        """
+        from gspread.exceptions import APIError
+
+        for attempt in range(self.max_retries + 1):
+            self.acquire(kind)
+            try:
+                result = func(*args, **kwargs)
+            except APIError as e:
+                status = getattr(e.response, "status_code", None) or e.code
+                if status not in SHEETS_RETRY_STATUSES or attempt == self.max_retries:
+                    raise
+                delay = self.backoff(kind, attempt, status)
+                print(f"Sheets APIの呼び出しが制限されたため、{delay:.1f}秒後に再試行します。({status})")
+                continue
+            with self.lock:
+                self.limits[kind] = min(self.max_limits[kind], self.limits[kind] + 1)
+            return result
+
+class GoogleSheetsWriter:
+    """
+    Googleスプレッドシートへの書き込みを行う
+    認証済みクライアントと、月ごとのワークシート・読み込んだ値を実行中はキャッシュして再利用する
+    API呼び出しはquota（SheetsQuotaController）で1分あたりの上限に収まるように待機・再試行する
+
+    差分の計算に使う現在の値は、シート全体ではなく書き込み先の範囲だけをbatch_getで読み込む。
+    読み込んだ値はスプレッドシートの最終更新時刻（リビジョン）とともにスナップショットとして保存し、
+    次の実行でリビジョンが変わっていなければ読み込まずに使う。
+    書き込み後のリビジョンは書き込みの後に取得するため、その間に手で編集された値は次に更新されるまで検出できない
+    """
+
+    def __init__(self, spreadsheet_name=None, incremental=True, quota=None, snapshot_path=None):
+        self.spreadsheet_name = spreadsheet_name or SHEET_NAME
+        self.incremental = incremental
+        self.quota = quota or SheetsQuotaController()
+        self.snapshot_path = snapshot_path or SHEET_SNAPSHOT_FILE
+        self.spreadsheet = None
+        self.worksheet_handles = {}  # ワークシート名(YYYY.MM) → worksheet
+        self.worksheets = {}  # ワークシート名(YYYY.MM) → 書き込み先の範囲の現在の値(sheet_data)
+        self.snapshot = None  # {"spreadsheet", "revision", "sheets": {ワークシート名: {"ranges", "values"}}}
+        self.revision = None  # この実行で確認したリビジョン
+        self.stats = {"api_calls": 0, "cells": 0, "changed": 0, "unchanged": 0, "snapshot_hits": 0}
+
+    def start_run(self):
+        """
+        daemonモードで次の実行を始める前に呼ぶ
+        認証済みクライアントとワークシートは使い回し、実行の間に手で編集されている可能性がある値はリビジョンを確認し直す
+        """
+        self.worksheets = {}
+        self.revision = None
+        self.stats = {"api_calls": 0, "cells": 0, "changed": 0, "unchanged": 0, "snapshot_hits": 0}
+
+    def connect(self):
+        """
+        Google Sheets APIの認証とスプレッドシートの取得（初回のみ）
+        """
+        if self.spreadsheet is not None:
+            return self.spreadsheet
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        with RUN_METRICS.timer("sheets_auth"):
+            credentials = Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE,
+                scopes=scope
+            )
+            gc = gspread.authorize(credentials)
+        self.spreadsheet = self.call_api("sheets_open", gc.open, self.spreadsheet_name)
+        return self.spreadsheet
+
+    def call_api(self, phase, func, *args, **kwargs):
+        """
+        Sheets APIを呼び出し、呼び出し回数と所要時間をphaseとして記録する
+        sheets_writeは書き込み、それ以外は読み込みの上限に数える（上限の待機時間はquota_waitに記録される）
+        """
+        kind = "write" if phase == "sheets_write" else "read"
+        with RUN_METRICS.timer(phase):
+            result = self.quota.call(kind, func, *args, **kwargs)
+        self.stats["api_calls"] += 1
+        RUN_METRICS.increment("sheets_api_calls")
+        return result
+
+    def get_worksheet(self, sheet_name):
+        """
+        月のワークシートを取得する（同じ月は1回だけ開く）
+        """
+        if sheet_name not in self.worksheet_handles:
+            self.worksheet_handles[sheet_name] = self.call_api("sheets_worksheet", self.connect().worksheet, sheet_name)
+        return self.worksheet_handles[sheet_name]
+
+    def get_revision(self):
+        """
+        スプレッドシートの最終更新時刻を取得する（実行中に1回だけ）
+        """
+        if self.revision is None:
+            self.revision = self.call_api("sheets_revision", self.connect().get_lastUpdateTime)
+        return self.revision
+
+    def load_snapshot(self):
+        """
+        保存済みのスナップショットを読み込む（このスプレッドシートのものでなければ空にする）
+        """
+        if self.snapshot is None:
+            try:
+                with open(self.snapshot_path, encoding="utf-8") as f:
+                    self.snapshot = json.load(f)
+            except (OSError, ValueError):
+                self.snapshot = None
+            if not self.snapshot or self.snapshot.get("spreadsheet") != self.spreadsheet_name:
+                self.snapshot = {"spreadsheet": self.spreadsheet_name, "revision": None, "sheets": {}}
+        return self.snapshot
+
+    def get_month_values(self, sheet_name):
+        """
+        月のワークシートの、書き込み先の範囲の現在の値を取得する（同じ月は実行中に1回だけ読み込む）
+        スナップショットのリビジョンが現在と同じで、範囲も同じ場合は読み込まずにスナップショットの値を使う
+        """
+        if sheet_name not in self.worksheets:
+            ranges = build_month_read_ranges(sheet_name)
+            snapshot = self.load_snapshot()
+            revision = self.get_revision()
+            if snapshot["revision"] != revision:
+                # 他の書き込みがあった場合は、全ワークシートの値を読み込み直す
+                snapshot.update(revision=revision, sheets={})
+            cached = snapshot["sheets"].get(sheet_name)
+            if cached and cached["ranges"] == ranges:
+                self.stats["snapshot_hits"] += 1
+            else:
+                sheet = self.get_worksheet(sheet_name)
+                value_ranges = self.call_api("sheets_read", sheet.batch_get, ranges)
+                cached = {"ranges": ranges, "values": build_sheet_data_from_ranges(ranges, value_ranges)}
+                snapshot["sheets"][sheet_name] = cached
+            self.worksheets[sheet_name] = cached["values"]
+        return self.worksheets[sheet_name]
+
+    def save_snapshot(self):
+        """
+        スナップショットを保存する。書き込んだ場合は、書き込み後のリビジョンを取得して保存する
+        リビジョンを取得できない場合は、古い値を使わないようにスナップショットを削除する
+        """
+        if self.snapshot is None:
+            return
+        try:
+            if self.stats["cells"]:
+                self.snapshot["revision"] = self.call_api("sheets_revision", self.connect().get_lastUpdateTime)
+            write_state_file(self.snapshot_path, json.dumps(self.snapshot, ensure_ascii=False))
+        except Exception as e:
+            print(f"シートのスナップショットを保存できませんでした: {e}")
+            self.snapshot = None
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+
+    def write(self, all_scout_data):
+        """
+        データを月ごとのワークシートに振り分け、月ごとに1回のbatch_updateで書き込む
+        """
+        from gspread.utils import rowcol_to_a1
+
+        entries_by_month = {}
+        for entry in all_scout_data:
+            entries_by_month.setdefault(get_month_sheet_name(entry["date"]), []).append(entry)
+
+        for sheet_name, entries in entries_by_month.items():
+            # 書き込み内容をまとめて組み立てる
+            updates = build_sheet_updates(entries)
+            if self.incremental:
+                sheet_data = self.get_month_values(sheet_name)
+                updates, unchanged_count = diff_sheet_updates(updates, sheet_data)
+                self.stats["unchanged"] += unchanged_count
+            self.stats["changed"] += len(updates)
+            batch = [
+                {"range": rowcol_to_a1(row, column), "values": [[value]]}
+                for row, column, value in updates
+            ]
+
+            # 該当セルにデータを一括で書き込む
+            if batch:
+                sheet = self.get_worksheet(sheet_name)
+                self.call_api("sheets_write", sheet.batch_update, batch, value_input_option="USER_ENTERED")
+                if self.incremental:
+                    apply_updates_to_sheet_data(sheet_data, updates)
+            self.stats["cells"] += len(batch)
+            print(f"{sheet_name}シートに{len(batch)}セルを書き込みました。")
+        return self.stats
+
+    def can_write_now(self):
+        """
+        書き込みの上限・バックオフで待たずに書き込めるかどうか（待つ場合、run_sync_pipelineは次の書き込みにまとめる）
+        """
+        return self.quota.can_call("write")
+
+    def close(self):
+        self.save_snapshot()
+
+    def print_stats(self):
+        print(f"変更あり: {self.stats['changed']}セル, 変更なし: {self.stats['unchanged']}セル")
+        print(f"書き込みセル数: {self.stats['cells']}, Sheets API呼び出し回数: {self.stats['api_calls']}")
+        if self.stats["snapshot_hits"]:
+            print(f"スナップショットを使い、読み込みを省略したシート: {self.stats['snapshot_hits']}")
+
+def build_export_row(entry):
+    """
+    all_scout_dataの1件を、項目ごとの列を持つ出力用の行にする（該当しない項目・"---"はNone）
+    """
+    row = {"date": entry["date"], "data_type": entry["data_type"], "contact_name": entry["contact_name"]}
+    for field in EXPORT_STATS_FIELDS:
+        row[field] = getattr(entry["stats"], field, None)
+    return row
+
+class FileExporter:
+    """
+    データを1行ずつファイルに追記する出力の共通処理
+    既存ファイルにある(date, data_type, contact_name)の行は追記しない。
+    値が変わった場合（取得時にまだ確定していなかった日）は、閉じるときにファイルを書き直して新しい値にする
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lines = None  # (date, data_type, contact_name) → ファイルの1行（ファイルの順）
+        self.rows = 0
+        self.updated = 0
+        self.skipped = 0
+        self.needs_rewrite = False
+
+    def open(self):
+        """
+        既存ファイルの行を読み込み、追記モードで開く
+        """
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self.lines = self.read_existing_lines() if exists else {}
+        self.file = open(self.path, "a", newline="", encoding="utf-8")
+        if not exists:
+            self.file.write(self.format_header())
+
+    def write(self, all_scout_data):
+        if self.file is None:
+            self.open()
+        for entry in all_scout_data:
+            key = (entry["date"], entry["data_type"], entry["contact_name"])
+            line = self.format_row(build_export_row(entry))
+            current = self.lines.get(key)
+            if current == line:
+                self.skipped += 1
+                continue
+            if current is None:
+                self.file.write(line)
+                self.rows += 1
+            else:
+                self.updated += 1
+                self.needs_rewrite = True
+            self.lines[key] = line
+        self.file.flush()
+
+    def rewrite(self):
+        """
+        値が変わった行を置き換えたファイルを一時ファイルに書き出し、元のファイルと入れ替える
+        """
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", newline="", encoding="utf-8") as f:
+            f.write(self.format_header())
+            f.writelines(self.lines.values())
+        os.replace(temp_path, self.path)
+        self.needs_rewrite = False
+
+    def read_existing_lines(self):
+        raise NotImplementedError
+
+    def format_header(self):
+        return ""
+
+    def format_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+        if self.needs_rewrite:
+            self.rewrite()
+
+    def print_stats(self):
+        print(
+            f"データを{self.path}に{self.rows}行追記し、値が変わった{self.updated}行を更新しました。"
+            f"（既存の行と同じ{self.skipped}行はスキップ）"
+        )
+
+class CsvWriter(FileExporter):
+    """
+    データをCSVファイルに追記する（項目ごとに1列、該当しない項目は空欄）
+    """
+
+    def __init__(self, path="ambi_data.csv"):
+        super().__init__(path)
+
+    @staticmethod
+    def format_values(values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    def read_existing_lines(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header != EXPORT_COLUMNS:
+                raise ValueError(f"{self.path}の列が現在の形式と異なるため追記できません。別のファイルを指定してください。")
+            return {tuple(row[:3]): self.format_values(row) for row in reader if row}
+
+    def format_header(self):
+        return self.format_values(EXPORT_COLUMNS)
+
+    def format_row(self, row):
+        return self.format_values(["" if row[column] is None else row[column] for column in EXPORT_COLUMNS])
+
+class NdjsonWriter(FileExporter):
+    """
+    データをNDJSON（1行に1件のJSON）ファイルに追記する
+    """
+
+    def __init__(self, path="ambi_data.ndjson"):
+        super().__init__(path)
+
+    def read_existing_lines(self):
+        lines = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    lines[(row["date"], row["data_type"], row["contact_name"])] = self.format_row(row)
+        return lines
+
+    def format_row(self, row):
+        return json.dumps(row, ensure_ascii=False) + "\n"
+
+class ParquetWriter:
+    """
+    データをParquetファイルに書き込む（pandasとpyarrowが必要）
+    Parquetは追記できないため、書き込んだ行をためておき、閉じるときに既存ファイルの行と合わせて書き直す。
+    (date, data_type, contact_name)が同じ行は新しい値にする
+    """
+
+    # 閉じるまでファイルに保存されないため、run_sync_pipelineは書き込み済みとしてチェックポイントに記録しない
+    writes_on_close = True
+
+    def __init__(self, path="ambi_data.parquet"):
+        self.path = path
+        self.rows = {}  # (date, data_type, contact_name) → 行
+        self.total_rows = 0
+
+    def write(self, all_scout_data):
+        for entry in all_scout_data:
+            row = build_export_row(entry)
+            self.rows[(row["date"], row["data_type"], row["contact_name"])] = row
+
+    def close(self):
+        if not self.rows:
+            return
+        import pandas as pd
+
+        frame = pd.DataFrame(list(self.rows.values()), columns=EXPORT_COLUMNS)
+        if os.path.exists(self.path):
+            existing = pd.read_parquet(self.path)
+            if list(existing.columns) != EXPORT_COLUMNS:
+                raise ValueError(f"{self.path}の列が現在の形式と異なるため追記できません。別のファイルを指定してください。")
+            frame = pd.concat([existing, frame], ignore_index=True).drop_duplicates(EXPORT_COLUMNS[:3], keep="last")
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        frame.to_parquet(temp_path, index=False)
+        os.replace(temp_path, self.path)
+        self.total_rows = len(frame)
+
+    def print_stats(self):
+        print(f"データを{self.path}に{len(self.rows)}行保存しました。（ファイル全体: {self.total_rows}行）")
+
+class DryRunWriter:
+    """
+    書き込みを行わず、書き込む予定のデータを表示する
+    """
+
+    def __init__(self):
+        self.rows = 0
+
+    def write(self, all_scout_data):
+        for entry in all_scout_data:
+            print(f"[dry-run] {entry['date']} {entry['data_type']} {entry['contact_name']}: {entry['stats']}")
+        self.rows += len(all_scout_data)
+
+    def close(self):
+        pass
+
+    def print_stats(self):
+        print(f"[dry-run] 書き込み予定: {self.rows}件（実際には書き込んでいません）")
+
+def get_output_path(output, output_path=None):
+    """
+    csv/ndjson/parquetの出力ファイル名（アカウント一覧から実行している場合は、ファイル名にアカウント名を付ける）
+    """
+    path = output_path or f"ambi_data.{output}"
+    if ACCOUNT_NAME:
+        root, ext = os.path.splitext(path)
+        path = f"{root}_{ACCOUNT_NAME}{ext}"
+    return path
+
+# 出力先ごとの書き込みクラス（選ばれた出力先のライブラリだけを読み込む）
+OUTPUT_WRITERS = {
+    "sheets": GoogleSheetsWriter,
+    "csv": CsvWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter,
+}
+
+def create_writer(output, output_path=None, dry_run=False):
+    """
+    出力先に応じた書き込みクラスを作成する
+    """
+    if dry_run:
+        return DryRunWriter()
+    if output == "sheets":
+        return GoogleSheetsWriter()
+    return OUTPUT_WRITERS[output](get_output_path(output, output_path))
+
+def write_to_google_sheets(all_scout_data, incremental=True):
+    # all_scout_data = [
+    #     {"date": "2025-01-01", "data_type": "platinum", "contact_name": "山中沙矢", "stats": ScoutStats(contact_name='山中沙矢', send_count=3, opens_count=0, open_rate=0.0, refusals_count=0, entry_count=0, post_opening_entry_rate=None, entry_rate=0.0, interview_req_count=0, interview_req_rate=None)},
+    #     {"date": "2025-01-02", "data_type": "regular", "contact_name": "橘萌生", "stats": ScoutStats(contact_name='橘萌生', send_count=2, opens_count=1, open_rate=50.0, refusals_count=0, entry_count=1, post_opening_entry_rate=100.0, entry_rate=50.0, interview_req_count=1, interview_req_rate=50.0)},
+    #     {"date": "2025-01-03", "data_type": "interested", "contact_name": "奥野翔子", "stats": InterestStats(contact_name='奥野翔子', interested_count=2, passed_judgement_count=0, passed_judgement_rate=0.0, entry_count=0, entry_rate=0.0, interview_req_count=0, interview_req_rate=None)},
+    # ]
+
+    """
+    データをGoogleスプレッドシートに書き込む
+    セル単位のupdate_cellではなく、月ごとの全更新を1回のbatch_updateでまとめて送信する
+    incrementalがTrueの場合は、シートの現在値と異なるセルだけを書き込む
+    """
+    writer = GoogleSheetsWriter(incremental=incremental)
+    try:
+        stats = writer.write(all_scout_data)
+    finally:
+        writer.close()
+
+    print("データの更新が完了しました！")
+    writer.print_stats()
+    return stats
+
+def print_run_timings(elapsed):
+    """
+    実行時間のうち、待機（頻度制限・ページ表示）に使った時間と処理時間を表示する
+    待機時間は全ワーカーの合計のため、並列実行時は経過時間を超えることがある
+    """
+    rate_limit_wait = RUN_METRICS.total("rate_limit_wait")
+    page_load = RUN_METRICS.total("page_load")
+    pages = RUN_METRICS.count("pages")
+    sheets_seconds = sum(
+        summary["total_seconds"]
+        for phase, summary in RUN_METRICS.snapshot()["phases"].items()
+        if phase.startswith("sheets_")
+    )
+    average_page_load = page_load / pages if pages else 0.0
+    print(
+        f"経過時間: {elapsed:.2f}秒 "
+        f"(ブラウザ起動: {RUN_METRICS.total('driver_startup'):.2f}秒, "
+        f"ログイン: {RUN_METRICS.total('login'):.2f}秒, "
+        f"頻度制限の待機: {rate_limit_wait:.2f}秒, "
+        f"ページ表示の待機: {page_load:.2f}秒, "
+        f"解析: {RUN_METRICS.total('parse'):.2f}秒, "
+        f"Sheets API: {sheets_seconds:.2f}秒, "
+        f"待機以外の処理: {max(elapsed - rate_limit_wait - page_load, 0.0):.2f}秒, "
+        f"取得ページ数: {pages}, "
+        f"1ページ平均: {average_page_load:.2f}秒)"
+    )
+    print(
+        f"WebDriverコマンド数: {RUN_METRICS.count('webdriver_commands')}, "
+        f"HTTPリクエスト数: {RUN_METRICS.count('http_requests')}, "
+        f"Sheets API呼び出し回数: {RUN_METRICS.count('sheets_api_calls')} "
+        f"(再試行: {RUN_METRICS.count('sheets_retries')}回, 上限の待機: {RUN_METRICS.total('quota_wait'):.2f}秒)"
+    )
+
+def build_run_report(started_at, elapsed, error=None, output=None, writer=None):
+    """
+    実行結果と計測値をまとめたレポート（JSONに保存できるdict）を作成する
+    """
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed_seconds": elapsed,
+        "status": "error" if error else "ok",
+        "error": str(error) if error else None,
+        "output": output,
+        "account": ACCOUNT_NAME,
+        **RUN_METRICS.snapshot(),
+    }
+    if isinstance(getattr(writer, "stats", None), dict):
+        report["writer"] = dict(writer.stats)
+    return report
+
+def format_prometheus_metrics(report):
+    """
+    レポートをPrometheusのテキスト形式にする（値は直近1回の実行分のためgaugeとする）
+    アカウント一覧から実行した場合は、全項目にaccountラベルを付ける
+    """
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    account_label = f'account="{escape(report["account"])}"' if report.get("account") else ""
+
+    finished_at = datetime.fromisoformat(report["finished_at"]).timestamp()
+    metrics = [
+        ("ambi_run_success", "直近の実行が成功したか（1: 成功, 0: 失敗）", [("", 1 if report["status"] == "ok" else 0)]),
+        ("ambi_run_timestamp_seconds", "直近の実行が終わった時刻（UNIX時間）", [("", finished_at)]),
+        ("ambi_run_duration_seconds", "直近の実行の経過時間", [("", report["elapsed_seconds"])]),
+        ("ambi_phase_seconds", "処理段階ごとの所要時間の合計", [
+            (f'phase="{escape(phase)}"', summary["total_seconds"]) for phase, summary in report["phases"].items()
+        ]),
+        ("ambi_phase_max_seconds", "処理段階ごとの所要時間の最大", [
+            (f'phase="{escape(phase)}"', summary["max_seconds"]) for phase, summary in report["phases"].items()
+        ]),
+        ("ambi_phase_calls", "処理段階ごとの実行回数", [
+            (f'phase="{escape(phase)}"', summary["count"]) for phase, summary in report["phases"].items()
+        ]),
+        ("ambi_run_events", "WebDriverコマンド・HTTPリクエスト・Sheets API呼び出しなどの回数", [
+            (f'event="{escape(counter)}"', value) for counter, value in report["counters"].items()
+        ]),
+    ]
+
+    lines = []
+    for name, help_text, samples in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            labels = ",".join(label for label in (account_label, labels) if label)
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_run_report(report, json_path=None, prom_path=None):
+    """
+    レポートをJSONファイルに書き出す。prom_pathが指定されていればPrometheusのtextfileも書き出す
+    （textfile collectorが書き込み途中のファイルを読まないよう、一時ファイルから置き換える）
+    Noneの場合は設定値（METRICS_JSON_FILE・METRICS_PROM_FILE）、空文字の場合は書き出さない
+    """
+    json_path = METRICS_JSON_FILE if json_path is None else json_path
+    prom_path = METRICS_PROM_FILE if prom_path is None else prom_path
+    try:
+        if json_path:
+            write_state_file(json_path, json.dumps(report, ensure_ascii=False, indent=2), mode=0o644)
+        if prom_path:
+            write_state_file(prom_path, format_prometheus_metrics(report), mode=0o644)
+    except OSError as e:
+        print(f"計測結果の書き出しに失敗しました: {e}")
+
+def parse_date_arg(value):
+    """
+    YYYY-MM-DD形式の日付引数を検証する
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日付はYYYY-MM-DD形式で指定してください: {value}")
+
+def parse_args(argv=None):
+    """
+    コマンドライン引数を解析する
+    """
+    today = datetime.today()
+    parser = argparse.ArgumentParser(description="AMBIのスカウト実績を取得して集計シートに書き込む")
+    parser.add_argument("--from", dest="date_from", type=parse_date_arg,
+                        default=(today - timedelta(days=3)).strftime("%Y-%m-%d"),
+                        help="取得開始日 (YYYY-MM-DD, 既定: 3日前)")
+    parser.add_argument("--to", dest="date_to", type=parse_date_arg,
+                        default=(today - timedelta(days=1)).strftime("%Y-%m-%d"),
+                        help="取得終了日 (YYYY-MM-DD, 既定: 昨日)")
+    parser.add_argument("--contacts", type=lambda value: [name.strip() for name in value.split(",") if name.strip()],
+                        help="書き込む担当者名（カンマ区切り, 既定: シートのレイアウトの全担当者）")
+    parser.add_argument("--data-types", type=lambda value: [name.strip() for name in value.split(",") if name.strip()],
+                        default=list(ENDPOINTS.keys()),
+                        help=f"取得するデータ種別（カンマ区切り: {','.join(ENDPOINTS.keys())}）")
+    parser.add_argument("--backend", choices=list(FETCH_BACKENDS), default=FETCH_BACKEND,
+                        help="データ取得方式")
+    parser.add_argument("--driver-profile", choices=["desktop", "server"], default=DRIVER_PROFILE,
+                        help="Seleniumで使うChromeの起動プロファイル")
+    parser.add_argument("--output", choices=list(OUTPUT_WRITERS), default="sheets",
+                        help="出力先（csv/ndjsonは既存ファイルに追記する）")
+    parser.add_argument("--output-path", help="csv/ndjson/parquetの出力ファイル名")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY,
+                        help="同時に取得するページ数の上限")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="取得のみ行い、書き込む予定のデータを表示する")
+    parser.add_argument("--force-refresh", action="store_true", default=CACHE_FORCE_REFRESH,
+                        help="キャッシュを使わずに全ページを取得し直す")
+    parser.add_argument("--resume", action="store_true",
+                        help="前回中断した実行をチェックポイントから再開する")
+    parser.add_argument("--metrics-json", default=METRICS_JSON_FILE,
+                        help="実行ごとの計測結果（JSON）の出力先")
+    parser.add_argument("--metrics-prom", default=METRICS_PROM_FILE,
+                        help="計測結果をPrometheusのtextfile形式でも書き出す場合の出力先")
+    parser.add_argument("--accounts", type=lambda value: [name.strip() for name in value.split(",") if name.strip()],
+                        help=f"アカウント一覧（{ACCOUNTS_FILE}）のうち集計するアカウント名（カンマ区切り, allで全アカウント）")
+    parser.add_argument("--account-workers", type=int, default=ACCOUNT_WORKERS,
+                        help="アカウントを同時に集計するプロセス数の上限")
+    parser.add_argument("--daemon", action="store_true",
+                        help="常駐して、一定間隔とローカルのトリガーで集計を実行する（ログイン・Sheetsの接続を使い回す）")
+    parser.add_argument("--interval", type=float, default=DAEMON_INTERVAL_MINUTES,
+                        help="daemonモードで集計する間隔（分, 0の場合はトリガーでのみ実行する）")
+    parser.add_argument("--trigger-port", type=int, default=DAEMON_TRIGGER_PORT,
+                        help="daemonモードのトリガーを待ち受けるポート（127.0.0.1）")
+    args = parser.parse_args(argv)
+
+    if args.date_from > args.date_to:
+        parser.error("--fromには--to以前の日付を指定してください")
+    unknown_data_types = [data_type for data_type in args.data_types if data_type not in ENDPOINTS]
+    if unknown_data_types:
+        parser.error(f"不明なデータ種別です: {', '.join(unknown_data_types)}")
+    if args.concurrency < 1:
+        parser.error("--concurrencyには1以上を指定してください")
+    if args.account_workers < 1:
+        parser.error("--account-workersには1以上を指定してください")
+    if args.daemon and args.accounts:
+        parser.error("--daemonと--accountsは同時に指定できません")
+    if args.interval < 0:
+        parser.error("--intervalには0以上を指定してください")
+    return args
+
+def load_accounts(path=None):
+    """
+    アカウント一覧を読み込み、必須項目とアカウント名（状態ファイルのディレクトリ名に使う）を検証する
+    """
+    path = path or ACCOUNTS_FILE
+    with open(path, encoding="utf-8") as f:
+        accounts = json.load(f)
+
+    names = set()
+    for account in accounts:
+        name = account.get("name") or "(名前なし)"
+        missing = [key for key in ("name", "pk", "login_id") if not account.get(key)]
+        if not account.get("password") and not account.get("password_env"):
+            missing.append("password")
+        if missing:
+            raise ValueError(f"{path}のアカウント{name}に{', '.join(missing)}がありません。")
+        if "/" in name or os.sep in name or name in (".", ".."):
+            raise ValueError(f"アカウント名にパスの区切り文字は使えません: {name}")
+        if name in names:
+            raise ValueError(f"アカウント名が重複しています: {name}")
+        names.add(name)
+    return accounts
+
+def select_accounts(accounts, names):
+    """
+    アカウント一覧から、指定された名前のアカウントを取り出す（"all"の場合は全アカウント）
+    """
+    if "all" in names:
+        return accounts
+    accounts_by_name = {account["name"]: account for account in accounts}
+    unknown_names = [name for name in names if name not in accounts_by_name]
+    if unknown_names:
+        raise ValueError(f"アカウント一覧にないアカウントです: {', '.join(unknown_names)}")
+    return [accounts_by_name[name] for name in names]
+
+def get_account_state_dir(name):
+    return os.path.join(STATE_DIR, "accounts", name)
+
+def apply_account(account):
+    """
+    このプロセスの設定（ログイン情報・PK・書き込み先・状態ファイル）をアカウント用に切り替える
+    1つのプロセスは1つのアカウントだけを集計するため、モジュールの設定値を書き換える
+    戻り値: アカウントの状態ファイルを置くディレクトリ
+    """
+    global ACCOUNT_NAME, AMBI_LOGIN_ID, AMBI_PASSWORD, COMMON_PARAMS, SHEET_NAME, SERVICE_ACCOUNT_FILE
+    global SHEET_LAYOUT_FILE, LAYOUT_INDEX, SESSION_COOKIE_FILE, CHECKPOINT_FILE, CACHE_DB_PATH, HISTORY_DB_PATH
+    global SHEET_SNAPSHOT_FILE, ACCOUNT_BASE_SETTINGS
+
+    password = account.get("password") or os.getenv(account.get("password_env", ""))
+    if not password:
+        raise ValueError(f"アカウント{account['name']}のパスワード（環境変数{account.get('password_env')}）が設定されていません。")
+
+    if ACCOUNT_BASE_SETTINGS is None:
+        ACCOUNT_BASE_SETTINGS = {name: globals()[name] for name in ACCOUNT_SETTING_NAMES}
+    base = ACCOUNT_BASE_SETTINGS
+
+    account_dir = get_account_state_dir(account["name"])
+    os.makedirs(account_dir, exist_ok=True)
+    ACCOUNT_NAME = account["name"]
+    AMBI_LOGIN_ID = account["login_id"]
+    AMBI_PASSWORD = password
+    COMMON_PARAMS = f"PK={account['pk']}"
+    SHEET_NAME = account.get("spreadsheet", base["SHEET_NAME"])
+    SERVICE_ACCOUNT_FILE = account.get("service_account_file", base["SERVICE_ACCOUNT_FILE"])
+    SHEET_LAYOUT_FILE = account.get("sheet_layout", base["SHEET_LAYOUT_FILE"])
+    LAYOUT_INDEX = None
+    # ログインCookie・チェックポイント・シートのスナップショット・キャッシュ・履歴は、アカウントごとのディレクトリに分ける
+    SESSION_COOKIE_FILE = os.path.join(account_dir, "cookies.json")
+    CHECKPOINT_FILE = os.path.join(account_dir, "checkpoint.jsonl")
+    SHEET_SNAPSHOT_FILE = os.path.join(account_dir, "sheet_snapshot.json")
+    CACHE_DB_PATH = os.path.join(account_dir, os.path.basename(base["CACHE_DB_PATH"]))
+    HISTORY_DB_PATH = os.path.join(account_dir, os.path.basename(base["HISTORY_DB_PATH"]))
+    return account_dir
+
+def run_account(account, argv):
+    """
+    1アカウント分の集計を実行する（run_accountsの子プロセスで呼ばれる）
+    メッセージはアカウントごとのログファイルに書き出し、実行結果のレポートを返す
+    """
+    # .envの設定を読み込んでから、アカウントの設定で上書きする
+    load_env_file()
+    account_dir = apply_account(account)
+    args = parse_args(argv)
+    metrics_json = os.path.join(account_dir, "run_metrics.json")
+    metrics_prom = ""
+    if args.metrics_prom:
+        root, ext = os.path.splitext(args.metrics_prom)
+        metrics_prom = f"{root}_{ACCOUNT_NAME}{ext}"
+    if os.path.exists(metrics_json):
+        os.remove(metrics_json)
+
+    with open(os.path.join(account_dir, "run.log"), "a", encoding="utf-8") as log, redirect_stdout(log):
+        print(f"\n===== {datetime.now().isoformat(timespec='seconds')} {ACCOUNT_NAME} =====")
+        main(list(argv) + ["--metrics-json", metrics_json, "--metrics-prom", metrics_prom])
+    with open(metrics_json, encoding="utf-8") as f:
+        return json.load(f)
+
+def print_account_report(name, report):
+    counters = report.get("counters", {})
+    elapsed = report.get("elapsed_seconds")
+    line = (
+        f"[{name}] {'成功' if report['status'] == 'ok' else '失敗'} "
+        f"経過時間: {f'{elapsed:.2f}秒' if elapsed is not None else '-'}, "
+        f"取得ページ数: {counters.get('pages', 0)}, "
+        f"Sheets API呼び出し回数: {counters.get('sheets_api_calls', 0)}"
+    )
+    if report.get("error"):
+        line += f", エラー: {report['error']}"
+    print(line)
+
+def run_accounts(args, argv):
+    """
+    アカウント一覧の各アカウントを別々のプロセスで並列に集計し、アカウントごとの結果と所要時間をまとめる
+    各プロセスは自分のログインセッション・ドライバー（またはHTTPクライアント）・書き込み先を持つ
+    """
+    accounts = select_accounts(load_accounts(), args.accounts)
+    max_workers = min(args.account_workers, len(accounts))
+    run_started = datetime.now()
+    run_started_at = time.monotonic()
+    print(
+        f"{len(accounts)}アカウントを最大{max_workers}プロセスで集計します。"
+        f"（ログ: {get_account_state_dir('<アカウント名>')}/run.log）"
+    )
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_account, account, argv): account["name"] for account in accounts}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                reports[name] = future.result()
+            except Exception as e:
+                reports[name] = {"status": "error", "error": str(e), "elapsed_seconds": None, "phases": {}, "counters": {}}
+            print_account_report(name, reports[name])
+
+    elapsed = time.monotonic() - run_started_at
+    total_elapsed = sum(report["elapsed_seconds"] or 0.0 for report in reports.values())
+    failed = [name for name, report in reports.items() if report["status"] != "ok"]
+    summary = {
+        "started_at": run_started.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "elapsed_seconds": elapsed,
+        "status": "error" if failed else "ok",
+        "error": f"失敗したアカウント: {', '.join(failed)}" if failed else None,
+        "accounts": {account["name"]: reports[account["name"]] for account in accounts},
+    }
+    print(f"全アカウントの経過時間: {elapsed:.2f}秒 (アカウントごとの経過時間の合計: {total_elapsed:.2f}秒)")
+    if failed:
+        print(summary["error"])
+    write_run_report(summary, args.metrics_json, "")
+    return summary
+
+def sync_tasks(args, writer, session=None):
+    """
+    指定期間のデータを取得して書き込む（1回分の集計）
+    session: daemonモードの場合、実行をまたいで使い回すログイン済みクライアントのプールを持つSyncSession
+    戻り値: 書き込み先を閉じた後に削除するチェックポイント（ない場合はNone）
+    """
+    client_pool = None
+    cache = None
+    history = None
+    try:
+        # データ収集
+        today = datetime.today()
+        start_date = datetime.strptime(args.date_from, "%Y-%m-%d")
+        end_date = datetime.strptime(args.date_to, "%Y-%m-%d")
+        dates = [(start_date + timedelta(n)).strftime("%Y-%m-%d") for n in range((end_date - start_date).days + 1)]
+        # 指定するjobNameのリスト（既定はシートのレイアウトに登録されている担当者）
+        layout_contact_names = get_layout_contact_names()
+        contact_names = args.contacts or layout_contact_names
+        tasks = [(date, data_type) for date in dates for data_type in args.data_types]
+
+        # --resumeの場合は前回のチェックポイントから、未書き込みの分だけを再開する
+        # （dry-runではチェックポイントを読むだけで、進捗の記録・削除はしない）
+        checkpoint_options = build_checkpoint_options(args)
+        checkpoint = RunCheckpoint.load(CHECKPOINT_FILE) if args.resume else None
+        if checkpoint:
+            # 前回と期間・出力先などが異なる場合は、前回の進捗を当てはめずに中止する
+            mismatched = checkpoint.find_mismatched_options(checkpoint_options)
+            if mismatched:
+                raise ValueError(
+                    f"チェックポイントの指定（{', '.join(mismatched)}）が今回の指定と異なるため再開できません。"
+                    f"前回と同じ指定で--resumeを付けるか、--resumeを付けずに最初から実行してください。"
+                )
+            tasks = checkpoint.unwritten_tasks()
+            dates = sorted({date for date, _ in tasks})
+            print(f"前回の実行を再開します: 未書き込み {len(tasks)}件, 取得済み {len(checkpoint.fetched)}件")
+        else:
+            if args.resume:
+                print("再開できるチェックポイントがないため、最初から実行します。")
+            if not args.dry_run:
+                checkpoint = RunCheckpoint.start(CHECKPOINT_FILE, tasks, checkpoint_options)
+
+        saved_checkpoint = checkpoint
+        if args.dry_run:
+            checkpoint = None
+
+        if not tasks:
+            if checkpoint:
+                checkpoint.complete()
+            print("書き込みが必要なデータはありません。")
+            return None
+
+        # 確定済みの過去日はキャッシュから読み込み、残りだけを取得する
+        cache = open_stats_cache(CACHE_DB_PATH)
+        history = open_history_store(HISTORY_DB_PATH)
+        results = load_cached_results(cache, tasks, args.force_refresh, today)
+        if saved_checkpoint:
+            results.update({key: value for key, value in saved_checkpoint.fetched_results().items() if key in tasks})
+        pending_tasks = [task for task in tasks if task not in results]
+        print(f"\n{dates[0]}〜{dates[-1]}のデータ収集を開始: 取得済み {len(results)}件, 取得 {len(pending_tasks)}件")
+
+        if pending_tasks:
+            # ログイン済みクライアントのプールを作成（ページ取得の頻度はトークンバケットで制限）
+            if session:
+                client_pool = session.get_client_pool(args)
+            else:
+                rate_limiter = TokenBucket(FETCH_RATE_PER_SEC, FETCH_RATE_BURST)
+                client_pool = create_client_pool(args.concurrency, args.backend, rate_limiter, args.driver_profile)
+
+        # 全担当者分を並列に取得しながら、そろった日から出力先に書き込む
+        # csv/ndjsonは1日分そろうごとに追記する
+        batch_days = 1 if args.output in ("csv", "ndjson") else WRITE_BATCH_DAYS
+        results = run_sync_pipeline(
+            client_pool, tasks, results, contact_names, writer, cache, batch_days,
+            checkpoint=checkpoint, max_workers=args.concurrency, history=history,
+        )
+        print("データの更新が完了しました！")
+
+        # レイアウトに登録されていない担当者が見つかった場合は報告する
+        found_contact_names = {
+            record.contact_name for day_results in results.values() for record in day_results
+        }
+        unknown_contacts = sorted(found_contact_names - set(layout_contact_names))
+        if unknown_contacts:
+            print(f"シートのレイアウトに登録されていない担当者が見つかりました: {', '.join(unknown_contacts)}")
+        return checkpoint
+    finally:
+        if client_pool and not session:
+            close_client_pool(client_pool)
+        if cache:
+            cache.close()
+        if history:
+            history.close()
+
+def run_sync(args, session=None):
+    """
+    1回分の集計を実行し、計測結果を表示・保存する
+    戻り値: 実行結果のレポート（build_run_report）
+    """
+    writer = session.get_writer(args) if session else create_writer(args.output, args.output_path, args.dry_run)
+    run_error = None
+    run_started = datetime.now()
+    run_started_at = time.monotonic()
+    RUN_METRICS.reset()
+
+    checkpoint = None
+    try:
+        checkpoint = sync_tasks(args, writer, session)
+    except Exception as e:
+        run_error = e
+        print(f"スクリプト実行中に致命的なエラーが発生しました: {e}")
+        # ドライバーの異常終了などに備えて、次の実行ではクライアントを作り直す
+        if session:
+            session.discard_client_pool()
+    finally:
+        # 途中で失敗した場合も、それまでに書き込んだ分はファイルに残す
+        # 閉じる際のエラー（Parquetの出力ライブラリがないなど）でも、計測結果のレポートは書き出す
+        try:
+            writer.close()
+            # 全件を書き込み、出力先に保存できてからチェックポイントを削除する
+            if checkpoint:
+                checkpoint.complete()
+        except Exception as e:
+            run_error = run_error or e
+            print(f"出力先を閉じる際にエラーが発生しました: {e}")
+        writer.print_stats()
+        elapsed = time.monotonic() - run_started_at
+        print_run_timings(elapsed)
+        report = build_run_report(run_started, elapsed, run_error, args.output, writer)
+        write_run_report(report, args.metrics_json, args.metrics_prom)
+    return report
+
+class SyncSession:
+    """
+    daemonモードで実行をまたいで使い回す接続
+    ログイン済みクライアントのプール（ブラウザまたはHTTPセッション）と、認証済みのSheetsの書き込み先を保持する。
+    セッション切れは取得時に検出して再ログインするため、ログインは初回と失敗後だけ行う
+    """
+
+    def __init__(self):
+        self.rate_limiter = TokenBucket(FETCH_RATE_PER_SEC, FETCH_RATE_BURST)
+        self.client_pool = None
+        self.client_pool_key = None
+        self.writer = None
+        self.writer_key = None
+
+    def get_client_pool(self, args):
+        key = (args.backend, args.concurrency, args.driver_profile)
+        if self.client_pool is not None and self.client_pool_key != key:
+            self.discard_client_pool()
+        if self.client_pool is None:
+            self.client_pool = create_client_pool(args.concurrency, args.backend, self.rate_limiter, args.driver_profile)
+            self.client_pool_key = key
+        return self.client_pool
+
+    def discard_client_pool(self):
+        if self.client_pool is not None:
+            close_client_pool(self.client_pool)
+            self.client_pool = None
+
+    def get_writer(self, args):
+        """
+        書き込み先を返す。start_runを持つ書き込み先（Sheets）は接続を保ったまま使い回し、それ以外は毎回作成する
+        """
+        key = (args.output, args.output_path, args.dry_run)
+        if self.writer is not None and self.writer_key == key and hasattr(self.writer, "start_run"):
+            self.writer.start_run()
+        else:
+            self.writer = create_writer(args.output, args.output_path, args.dry_run)
+            self.writer_key = key
+        return self.writer
+
+    def close(self):
+        self.discard_client_pool()
+        if self.writer is not None:
+            self.writer.close()
+
+class SyncRequest:
+    """
+    daemonに依頼する1回分の集計（argvは起動時の引数に追加する引数）
+    """
+
+    def __init__(self, argv=(), reason="schedule"):
+        self.argv = list(argv)
+        self.reason = reason
+        self.report = None
+        self.done = threading.Event()
+
+# トリガーで指定できるクエリパラメータと、対応するコマンドライン引数
+DAEMON_TRIGGER_PARAMS = {
+    "from": "--from",
+    "to": "--to",
+    "contacts": "--contacts",
+    "data_types": "--data-types",
+    "force_refresh": "--force-refresh",
+}
+
+class SyncDaemon:
+    """
+    常駐して、interval分ごとと、ローカルのHTTPトリガーで依頼されたときに集計を実行する
+    実行は1つずつ順番に行い、ログイン済みのクライアントとSheetsの接続は実行をまたいで使い回す
+    トリガー（127.0.0.1のみ。AMBI_DAEMON_TOKENを設定した場合はX-AMBI-Tokenヘッダーが必要）:
+      POST /sync?from=YYYY-MM-DD&to=YYYY-MM-DD&contacts=...&data_types=...  集計を実行し、レポート（JSON）を返す
+      GET /status  直近のレポートと次回の実行予定
+      POST /stop  終了する
+    """
+
+    def __init__(self, argv, interval=None, trigger_port=None):
+        self.argv = list(argv)
+        self.interval = (DAEMON_INTERVAL_MINUTES if interval is None else interval) * 60
+        self.trigger_port = DAEMON_TRIGGER_PORT if trigger_port is None else trigger_port
+        self.session = SyncSession()
+        self.requests = queue.Queue()
+        self.server = None
+        self.last_report = None
+        self.next_run_at = None
+        self.running = False
+
+    @property
+    def trigger_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def build_args(self, request_argv):
+        """
+        起動時の引数にトリガーの引数を追加して解析する（既定の期間は実行するたびに今日から計算し直す）
+        """
+        return parse_args(self.argv + request_argv)
+
+    def open(self):
+        """
+        トリガー用のHTTPサーバーを別スレッドで起動する
+        """
+        if self.server is None:
+            self.server = create_trigger_server(self, self.trigger_port)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            print(f"集計のトリガーを待ち受けています: {self.trigger_url}/sync")
+        return self
+
+    def request_sync(self, request_argv, reason="trigger"):
+        """
+        集計を依頼し、実行が終わるまで待ってレポートを返す（トリガーのスレッドから呼ばれる）
+        """
+        request = SyncRequest(request_argv, reason)
+        self.requests.put(request)
+        request.done.wait()
+        return request.report
+
+    def stop(self):
+        self.requests.put(None)
+
+    def run(self):
+        """
+        依頼・スケジュールに従って集計を繰り返す（stopまたはCtrl+Cで終了する）
+        """
+        import signal
+
+        self.open()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        self.next_run_at = time.monotonic() if self.interval > 0 else None
+        try:
+            while True:
+                timeout = None if self.next_run_at is None else max(self.next_run_at - time.monotonic(), 0.0)
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    request = SyncRequest()
+                    self.next_run_at = time.monotonic() + self.interval
+                if request is None:
+                    break
+                self.run_request(request)
+        except KeyboardInterrupt:
+            print("中断されました。")
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            self.session.close()
+            print("daemonを終了しました。")
+        return self.last_report
+
+    def run_request(self, request):
+        print(f"\n===== {datetime.now().isoformat(timespec='seconds')} 集計を開始します（{request.reason}） =====")
+        self.running = True
+        try:
+            request.report = run_sync(self.build_args(request.argv), self.session)
+        except Exception as e:
+            request.report = {"status": "error", "error": str(e)}
+        finally:
+            self.running = False
+            self.last_report = request.report
+            request.done.set()
+
+    def get_status(self):
+        next_run_in = None if self.next_run_at is None else max(self.next_run_at - time.monotonic(), 0.0)
+        return {"running": self.running, "next_run_in_seconds": next_run_in, "last_report": self.last_report}
+
+def create_trigger_server(daemon, port):
+    """
+    daemonのトリガーを受け付けるHTTPサーバー（127.0.0.1で待ち受ける）を作成する
+    同じPCのブラウザで開いたWebページからも127.0.0.1には要求を送れるため、
+    Originヘッダーのある要求（ブラウザからの要求）は拒否し、トークンが設定されていれば一致を確認する
+    """
+    import hmac
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class TriggerHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def authorize(self):
+            if self.headers.get("Origin") is not None:
+                self.send_json({"error": "cross-origin requests are not allowed"}, 403)
+                return False
+            token = self.headers.get("X-AMBI-Token", "")
+            if DAEMON_TRIGGER_TOKEN and not hmac.compare_digest(token.encode("utf-8"), DAEMON_TRIGGER_TOKEN.encode("utf-8")):
+                self.send_json({"error": "invalid token"}, 401)
+                return False
+            return True
+
+        def do_GET(self):
+            if not self.authorize():
+                return
+            if urlparse(self.path).path == "/status":
+                self.send_json(daemon.get_status())
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            if not self.authorize():
+                return
+            url = urlparse(self.path)
+            if url.path == "/stop":
+                daemon.stop()
+                self.send_json({"status": "stopping"})
+                return
+            if url.path != "/sync":
+                self.send_json({"error": "not found"}, 404)
+                return
+
+            request_argv = []
+            for name, values in parse_qs(url.query).items():
+                if name not in DAEMON_TRIGGER_PARAMS:
+                    self.send_json({"error": f"unknown parameter: {name}"}, 400)
+                    return
+                if name == "force_refresh":
+                    if values[-1] == "1":
+                        request_argv.append(DAEMON_TRIGGER_PARAMS[name])
+                else:
+                    request_argv += [DAEMON_TRIGGER_PARAMS[name], values[-1]]
+            # 引数の誤りは実行を依頼する前に返す
+            try:
+                daemon.build_args(request_argv)
+            except SystemExit:
+                self.send_json({"error": "invalid parameters"}, 400)
+                return
+
+            report = daemon.request_sync(request_argv)
+            self.send_json(report, 200 if report.get("status") == "ok" else 500)
+
+    return ThreadingHTTPServer(("127.0.0.1", port), TriggerHandler)
+
+def main(argv=None):
+    load_env_file()
+    args = parse_args(argv)
+    argv = sys.argv[1:] if argv is None else argv
+    # --accountsの場合は、アカウントごとの子プロセスでこの関数を実行する
+    if args.accounts and ACCOUNT_NAME is None:
+        try:
+            return run_accounts(args, argv)
+        except (OSError, ValueError) as e:
+            print(f"アカウント一覧を読み込めませんでした: {e}")
+            return None
+    if args.daemon:
+        return SyncDaemon(argv, args.interval, args.trigger_port).run()
+    return run_sync(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,485 @@
+import os
+import copy
+import random
+import threading
+import time
+import http.server
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+from bs4 import BeautifulSoup
+
+# AMBI・Google Sheetsに接続せずに取得・書き込みを試すためのテスト用部品
+# （保存済みのAMBIのページを返すローカルHTTPサーバーと、呼び出し回数を数えるgspreadの代替）
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ambi")
+
+# 保存済みページのパス（ambi_auto_calculation.ENDPOINTSと同じ構成）
+FIXTURE_BASE_PATH = "/company/effect_ma"
+FIXTURE_LOGIN_PATH = "/company/login/"
+FIXTURE_ENDPOINTS = {
+    "/acc_scout/platinum/": "platinum",
+    "/acc_scout/": "regular",
+    "/acc_interests/": "interested",
+}
+FIXTURE_LOGIN_ID = "fixture-user"
+FIXTURE_PASSWORD = "fixture-password"
+FIXTURE_SESSION_COOKIE = "AMBISESSID"
+
+# 保存済みページに含まれる担当者（それ以降はfixture_contact_namesで連番の担当者を作る）
+FIXTURE_CONTACT_NAMES = ["山中沙矢", "橘萌生", "奥野翔子"]
+
+# 1日分の件数の上限（データ種別ごと）
+SCOUT_DAILY_MAX_SEND = 20
+INTEREST_DAILY_MAX = 8
+
+def load_fixture(name):
+    """
+    保存済みのページ（fixtures/ambi/<name>.html）を読み込む
+    """
+    with open(os.path.join(FIXTURE_DIR, f"{name}.html"), encoding="utf-8") as f:
+        return f.read()
+
+def fixture_contact_names(count):
+    """
+    担当者名をcount人分返す（保存済みページの担当者の後に、担当者004のような連番の担当者を続ける）
+    """
+    names = FIXTURE_CONTACT_NAMES[:count]
+    names += [f"担当者{number:03d}" for number in range(len(names) + 1, count + 1)]
+    return names
+
+def build_fixture_layout(contact_names):
+    """
+    担当者ごとの書き込み開始行を、DEFAULT_SHEET_LAYOUTと同じ17行間隔で割り当てる
+    """
+    return {
+        contact_name: {"platinum": 20 + index * 17, "regular": 25 + index * 17, "interested": 30 + index * 17}
+        for index, contact_name in enumerate(contact_names)
+    }
+
+def fixture_settings(server, state_dir, contact_names=None):
+    """
+    ambi_auto_calculationの接続先・ログイン情報・レイアウトをフィクスチャに向けるための {属性名: 値}
+    ログインCookieはstate_dirに保存する（前回のCookieを再利用せず、毎回ログインさせる）
+    """
+    import ambi_auto_calculation as ambi
+
+    return {
+        "AMBI_LOGIN_URL": server.login_url,
+        "BASE_URL": server.base_url,
+        "AMBI_LOGIN_ID": FIXTURE_LOGIN_ID,
+        "AMBI_PASSWORD": FIXTURE_PASSWORD,
+        "SESSION_COOKIE_FILE": os.path.join(state_dir, "cookies.json"),
+        "SHEET_SNAPSHOT_FILE": os.path.join(state_dir, "sheet_snapshot.json"),
+        "LAYOUT_INDEX": ambi.build_layout_index(build_fixture_layout(contact_names or server.renderer.contact_names)),
+    }
+
+def iter_dates(date_from, date_to):
+    current = datetime.strptime(date_from, "%Y-%m-%d")
+    end = datetime.strptime(date_to, "%Y-%m-%d")
+    while current <= end:
+        yield current.strftime("%Y-%m-%d")
+        current += timedelta(days=1)
+
+def fixture_daily_counts(data_type, contact_name, date, active_ratio=0.3):
+    """
+    1日・1担当者分の件数を返す（同じ引数なら常に同じ値）
+    active_ratioの割合の日だけ件数があり、残りの日は0件になる
+    """
+    rng = random.Random(f"{data_type}|{contact_name}|{date}")
+    active = rng.random() < active_ratio
+    if data_type == "interested":
+        interested = rng.randint(1, INTEREST_DAILY_MAX) if active else 0
+        passed = rng.randint(0, interested)
+        entry = rng.randint(0, passed)
+        return {
+            "interested_count": interested,
+            "passed_judgement_count": passed,
+            "entry_count": entry,
+            "interview_req_count": rng.randint(0, entry),
+        }
+    send = rng.randint(1, SCOUT_DAILY_MAX_SEND) if active else 0
+    opens = rng.randint(0, send)
+    entry = rng.randint(0, opens)
+    return {
+        "send_count": send,
+        "opens_count": opens,
+        "refusals_count": rng.randint(0, send - opens),
+        "entry_count": entry,
+        "interview_req_count": rng.randint(0, entry),
+    }
+
+def format_count(value):
+    return f"{value:,}"
+
+def format_rate(numerator, denominator):
+    return f"{numerator / denominator * 100:.1f}%" if denominator else "---"
+
+def build_fixture_cells(data_type, counts):
+    """
+    期間の件数から、集計表の1行分（担当者名を除く）のセルのテキストを作る
+    """
+    if data_type == "interested":
+        return [
+            format_count(counts["interested_count"]),
+            format_count(counts["passed_judgement_count"]),
+            format_rate(counts["passed_judgement_count"], counts["interested_count"]),
+            format_count(counts["entry_count"]),
+            format_rate(counts["entry_count"], counts["interested_count"]),
+            format_count(counts["interview_req_count"]),
+            format_rate(counts["interview_req_count"], counts["entry_count"]),
+        ]
+    return [
+        format_count(counts["send_count"]),
+        format_count(counts["opens_count"]),
+        format_rate(counts["opens_count"], counts["send_count"]),
+        format_count(counts["refusals_count"]),
+        format_count(counts["entry_count"]),
+        format_rate(counts["entry_count"], counts["opens_count"]),
+        format_rate(counts["entry_count"], counts["send_count"]),
+        format_count(counts["interview_req_count"]),
+        format_rate(counts["interview_req_count"], counts["entry_count"]),
+    ]
+
+class FixturePageRenderer:
+    """
+    保存済みページの集計表の行をひな形にして、任意の担当者・期間のページを作る
+    期間のページは日別の件数の合計を返す（AMBIの期間指定と同じ）
+    """
+
+    def __init__(self, contact_names=None, active_ratio=0.3):
+        self.contact_names = contact_names or list(FIXTURE_CONTACT_NAMES)
+        self.active_ratio = active_ratio
+        self.daily_cache = {}
+        self.templates = {data_type: self.build_template(data_type) for data_type in FIXTURE_ENDPOINTS.values()}
+
+    @staticmethod
+    def build_template(data_type):
+        """
+        保存済みページから、行を差し込む前後のHTMLと1行分のひな形を取り出す
+        """
+        soup = BeautifulSoup(load_fixture(data_type), "html.parser")
+        rows = [job_name.find_parent("tr") for job_name in soup.select("div.jobName")]
+
+        # 1行目の担当者名と各セルを置き換え用の文字列にして、行のひな形にする
+        row_template = copy.copy(rows[0])
+        cells = row_template.select(".data")
+        cells[0].select_one("div.jobName").string = "@@contact_name@@"
+        for index, cell in enumerate(cells[1:]):
+            cell.string = f"@@cell{index}@@"
+
+        tbody = rows[0].parent
+        for row in rows:
+            row.extract()
+        marker = "<!--fixture-rows-->"
+        tbody.append(BeautifulSoup(marker, "html.parser"))
+        head, tail = str(soup).split(marker)
+        return head, str(row_template), tail
+
+    def daily_counts(self, data_type, contact_name, date):
+        key = (data_type, contact_name, date)
+        if key not in self.daily_cache:
+            self.daily_cache[key] = fixture_daily_counts(data_type, contact_name, date, self.active_ratio)
+        return self.daily_cache[key]
+
+    def range_counts(self, data_type, contact_name, date_from, date_to):
+        totals = Counter()
+        for date in iter_dates(date_from, date_to):
+            totals.update(self.daily_counts(data_type, contact_name, date))
+        return totals
+
+    def render(self, data_type, date_from, date_to):
+        head, row_template, tail = self.templates[data_type]
+        rows = []
+        for contact_name in self.contact_names:
+            row = row_template.replace("@@contact_name@@", contact_name)
+            texts = build_fixture_cells(data_type, self.range_counts(data_type, contact_name, date_from, date_to))
+            for index, text in enumerate(texts):
+                row = row.replace(f"@@cell{index}@@", text)
+            rows.append(row)
+        return head + "\n".join(rows) + tail
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    """
+    保存済みのAMBIのページを返すローカルHTTPサーバー
+    ログインフォーム（hidden項目つき）とCookieによるセッションを再現する。Cookieがない集計ページの要求にはログイン画面を返す
+    latency: 集計ページを返すまでの待ち時間（秒）。AMBIの応答時間を再現する
+    requests: 種類ごとの要求回数（login_form, login, page, expired, maintenance）
+    """
+
+    daemon_threads = True
+
+    def __init__(self, contact_names=None, active_ratio=0.3, latency=0.0):
+        super().__init__(("127.0.0.1", 0), FixtureRequestHandler)
+        self.renderer = FixturePageRenderer(contact_names, active_ratio)
+        self.latency = latency
+        self.sessions = set()
+        self.maintenance_pages = 0
+        self.maintenance_after = 0
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def login_url(self):
+        return f"{self.url}{FIXTURE_LOGIN_PATH}"
+
+    @property
+    def base_url(self):
+        return f"{self.url}{FIXTURE_BASE_PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def expire_sessions(self):
+        """
+        ログイン済みのセッションをすべて無効にする（セッション切れの再現）
+        """
+        with self.lock:
+            self.sessions.clear()
+
+    def serve_maintenance(self, count=1, after=0):
+        """
+        after回の集計ページの要求の後、次のcount回の要求にHTTP 200でメンテナンス画面を返す
+        """
+        with self.lock:
+            self.maintenance_pages += count
+            self.maintenance_after = after
+
+    def take_maintenance_page(self):
+        with self.lock:
+            if self.maintenance_pages <= 0:
+                return False
+            if self.maintenance_after > 0:
+                self.maintenance_after -= 1
+                return False
+            self.maintenance_pages -= 1
+            return True
+
+    def count(self, kind):
+        with self.lock:
+            self.requests[kind] += 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class FixtureRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_html(self, body, status=200, cookie=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def session_id(self):
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == FIXTURE_SESSION_COOKIE:
+                return value
+        return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == FIXTURE_LOGIN_PATH:
+            self.server.count("login_form")
+            return self.send_html(load_fixture("login"))
+
+        relative_path = url.path[len(FIXTURE_BASE_PATH):] if url.path.startswith(FIXTURE_BASE_PATH) else None
+        data_type = FIXTURE_ENDPOINTS.get(relative_path)
+        if data_type is None:
+            return self.send_html("<p>Not Found</p>", status=404)
+
+        with self.server.lock:
+            logged_in = self.session_id() in self.server.sessions
+        if not logged_in:
+            self.server.count("expired")
+            return self.send_html(load_fixture("login"))
+
+        # _pp_=date_from=YYYY-MM-DD|date_to=YYYY-MM-DD
+        period = dict(
+            item.split("=", 1)
+            for item in parse_qs(url.query).get("_pp_", [""])[0].split("|")
+            if "=" in item
+        )
+        if self.server.take_maintenance_page():
+            self.server.count("maintenance")
+            return self.send_html(load_fixture("maintenance"))
+        self.server.count("page")
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_html(self.server.renderer.render(data_type, period["date_from"], period["date_to"]))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        self.server.count("login")
+        if (
+            urlparse(self.path).path != FIXTURE_LOGIN_PATH
+            or form.get("accLoginID") != [FIXTURE_LOGIN_ID]
+            or form.get("accLoginPW") != [FIXTURE_PASSWORD]
+            or not form.get("token")
+        ):
+            return self.send_html(load_fixture("login"))
+
+        session_id = f"fixture{random.getrandbits(64):016x}"
+        with self.server.lock:
+            self.server.sessions.add(session_id)
+        self.send_html(
+            "<html><body><div id=\"contents\">ログインしました</div></body></html>",
+            cookie=f"{FIXTURE_SESSION_COOKIE}={session_id}; Path=/",
+        )
+
+def column_letter_to_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+def a1_to_bounds(a1_range):
+    """
+    "G20"・"G20:AK96"の形式のセル範囲を (開始行, 開始列, 終了行, 終了列) にする
+    """
+    def parse_cell(cell):
+        letters = cell.rstrip("0123456789")
+        return int(cell[len(letters):]), column_letter_to_number(letters)
+
+    start, _, end = a1_range.split("!")[-1].partition(":")
+    start_row, start_column = parse_cell(start)
+    end_row, end_column = parse_cell(end) if end else (start_row, start_column)
+    return start_row, start_column, end_row, end_column
+
+class FakeWorksheet:
+    """
+    gspreadのWorksheetの代わりに、値をメモリ上に持つワークシート
+    呼び出した操作の回数をspreadsheet.callsに数える。latencyを指定するとAPIの応答時間を再現する
+    """
+
+    def __init__(self, spreadsheet, title, values=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.values = values or []
+
+    def record_call(self, name):
+        self.spreadsheet.record_call(name)
+
+    def get_all_values(self):
+        self.record_call("get_all_values")
+        width = max((len(row) for row in self.values), default=0)
+        return [row + [""] * (width - len(row)) for row in self.values]
+
+    def batch_get(self, ranges, **kwargs):
+        self.record_call("batch_get")
+        results = []
+        for a1_range in ranges:
+            start_row, start_column, end_row, end_column = a1_to_bounds(a1_range)
+            results.append([
+                [self.cell_value(row, column) for column in range(start_column, end_column + 1)]
+                for row in range(start_row, end_row + 1)
+            ])
+        return results
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        self.record_call("batch_update")
+        for update in data:
+            start_row, start_column, _, _ = a1_to_bounds(update["range"])
+            for row_offset, row_values in enumerate(update["values"]):
+                for column_offset, value in enumerate(row_values):
+                    self.set_cell_value(start_row + row_offset, start_column + column_offset, value)
+        return {"totalUpdatedCells": sum(len(row) for update in data for row in update["values"])}
+
+    def cell_value(self, row, column):
+        if row <= len(self.values) and column <= len(self.values[row - 1]):
+            return self.values[row - 1][column - 1]
+        return ""
+
+    def set_cell_value(self, row, column, value):
+        self.spreadsheet.revision += 1
+        while len(self.values) < row:
+            self.values.append([])
+        cells = self.values[row - 1]
+        while len(cells) < column:
+            cells.append("")
+        cells[column - 1] = str(value)
+
+def build_api_error(status):
+    """
+    Sheets APIがstatusを返した場合にgspreadが送出するAPIErrorを作る
+    """
+    import json
+    import requests
+    from gspread.exceptions import APIError
+
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({
+        "error": {"code": status, "message": f"fixture error {status}", "status": "RESOURCE_EXHAUSTED"},
+    }).encode("utf-8")
+    return APIError(response)
+
+class FakeSpreadsheet:
+    """
+    gspreadのSpreadsheetの代わりに、FakeWorksheetを名前で返すスプレッドシート
+    calls: 操作ごとの呼び出し回数（Sheets APIの呼び出し回数に相当する）
+    fail_next(name, status): nameの次の呼び出しでAPIErrorを送出する（上限超過・サーバーエラーの再現）
+    revision: セルの値が変わるたびに増える番号（get_lastUpdateTimeの最終更新時刻になる）
+    """
+
+    def __init__(self, title="テスト", sheet_names=(), latency=0.0):
+        self.title = title
+        self.latency = latency
+        self.calls = Counter()
+        self.failures = {}  # 操作名 → 次の呼び出しから順に返すステータスコード
+        self.revision = 0
+        self.lock = threading.Lock()
+        self.worksheets = {name: FakeWorksheet(self, name) for name in sheet_names}
+
+    def fail_next(self, name, *statuses):
+        with self.lock:
+            self.failures.setdefault(name, []).extend(statuses)
+
+    def record_call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            failures = self.failures.get(name)
+            status = failures.pop(0) if failures else None
+        if self.latency:
+            time.sleep(self.latency)
+        if status:
+            raise build_api_error(status)
+
+    def worksheet(self, title):
+        self.record_call("worksheet")
+        if title not in self.worksheets:
+            import gspread
+
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def get_lastUpdateTime(self):
+        self.record_call("get_lastUpdateTime")
+        modified_at = datetime(2025, 1, 1) + timedelta(milliseconds=self.revision)
+        return modified_at.isoformat(timespec="milliseconds") + "Z"
+
+    @property
+    def api_calls(self):
+        return sum(self.calls.values())
@@ -0,0 +1,140 @@
+import io
+import json
+import argparse
+import statistics
+import tempfile
+import time
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime, timedelta
+
+import ambi_auto_calculation as ambi
+from ambi_fixtures import FakeSpreadsheet, FixtureServer, fixture_contact_names, fixture_settings
+
+# AMBI・Google Sheetsに接続せずに、ログイン・取得・解析・書き込みの所要時間を計測する
+# 保存済みページを返すローカルサーバー（ambi_fixtures.FixtureServer）と、メモリ上のスプレッドシート（FakeSpreadsheet）を使う
+# 例: python benchmark.py --days 30 --contacts 10 --repeat 3 --page-latency 0.05
+
+# 結果の表示順と見出し
+BENCHMARK_COLUMNS = [
+    ("total_seconds", "合計"),
+    ("login_seconds", "ログイン"),
+    ("pipeline_seconds", "取得・書き込み"),
+    ("fetch_seconds", "ページ取得"),
+    ("parse_seconds", "解析"),
+    ("write_seconds", "Sheets API"),
+]
+
+def run_benchmark(days, contacts, backend="http", concurrency=ambi.FETCH_CONCURRENCY, page_latency=0.0,
+                  sheets_latency=0.0, active_ratio=0.3, start_date="2025-01-01", driver_profile="server", verbose=False):
+    """
+    N日 × M担当者分を、フィクスチャサーバーから取得してFakeSpreadsheetに書き込み、段階ごとの所要時間を返す
+    """
+    contact_names = fixture_contact_names(contacts)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    dates = [(start + timedelta(days=n)).strftime("%Y-%m-%d") for n in range(days)]
+    tasks = [(date, data_type) for date in dates for data_type in ambi.ENDPOINTS]
+    sheet_names = sorted({ambi.get_month_sheet_name(date) for date in dates})
+
+    with tempfile.TemporaryDirectory() as state_dir, FixtureServer(contact_names, active_ratio, page_latency) as server:
+        settings = fixture_settings(server, state_dir, contact_names)
+        previous = {name: getattr(ambi, name) for name in settings}
+        for name, value in settings.items():
+            setattr(ambi, name, value)
+
+        spreadsheet = FakeSpreadsheet(sheet_names=sheet_names, latency=sheets_latency)
+        writer = ambi.GoogleSheetsWriter()
+        writer.spreadsheet = spreadsheet
+        client_pool = None
+        output = io.StringIO()
+        try:
+            ambi.RUN_METRICS.reset()
+            with nullcontext() if verbose else redirect_stdout(output):
+                started_at = time.monotonic()
+                client_pool = ambi.create_client_pool(concurrency, backend, None, driver_profile)
+                logged_in_at = time.monotonic()
+                ambi.run_sync_pipeline(client_pool, tasks, {}, contact_names, writer, max_workers=concurrency)
+                finished_at = time.monotonic()
+        finally:
+            if client_pool:
+                ambi.close_client_pool(client_pool)
+            for name, value in previous.items():
+                setattr(ambi, name, value)
+
+    metrics = ambi.RUN_METRICS.snapshot()
+    return {
+        "days": days,
+        "contacts": contacts,
+        "backend": backend,
+        "concurrency": concurrency,
+        "total_seconds": finished_at - started_at,
+        "login_seconds": logged_in_at - started_at,
+        "pipeline_seconds": finished_at - logged_in_at,
+        "fetch_seconds": metrics["phases"].get("page_load", {}).get("total_seconds", 0.0),
+        "parse_seconds": metrics["phases"].get("parse", {}).get("total_seconds", 0.0),
+        "write_seconds": sum(
+            summary["total_seconds"] for phase, summary in metrics["phases"].items() if phase.startswith("sheets_")
+        ),
+        "pages": metrics["counters"].get("pages", 0),
+        "cells_written": writer.stats["cells"],
+        "server_requests": dict(server.requests),
+        "sheets_calls": dict(spreadsheet.calls),
+        "metrics": metrics,
+    }
+
+def summarize_runs(runs):
+    """
+    複数回の計測結果から、各段階の所要時間の中央値・最小値を求める
+    """
+    return {
+        key: {
+            "median": statistics.median(run[key] for run in runs),
+            "min": min(run[key] for run in runs),
+        }
+        for key, _ in BENCHMARK_COLUMNS
+    }
+
+def print_summary(runs, summary):
+    first = runs[0]
+    print(
+        f"{first['days']}日 × {first['contacts']}担当者 (取得方式: {first['backend']}, 同時接続数: {first['concurrency']}, "
+        f"実行回数: {len(runs)})"
+    )
+    for key, label in BENCHMARK_COLUMNS:
+        print(f"  {label}: 中央値 {summary[key]['median']:.3f}秒, 最小 {summary[key]['min']:.3f}秒")
+    print(
+        f"  取得ページ数: {first['pages']}, 書き込みセル数: {first['cells_written']}, "
+        f"サーバーへの要求: {first['server_requests']}, Sheets API: {first['sheets_calls']}"
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AMBIの取得・書き込みをオフラインで計測する")
+    parser.add_argument("--days", type=int, default=30, help="取得する日数")
+    parser.add_argument("--contacts", type=int, default=3, help="担当者の人数")
+    parser.add_argument("--backend", choices=["http", "selenium"], default="http", help="データ取得方式")
+    parser.add_argument("--concurrency", type=int, default=ambi.FETCH_CONCURRENCY, help="同時に取得するページ数の上限")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="集計ページの応答までの待ち時間（秒）")
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="Sheets API 1回あたりの待ち時間（秒）")
+    parser.add_argument("--active-ratio", type=float, default=0.3, help="件数のある日の割合")
+    parser.add_argument("--repeat", type=int, default=3, help="計測する回数")
+    parser.add_argument("--json", dest="json_path", help="計測結果をJSONで保存するファイル名")
+    parser.add_argument("--verbose", action="store_true", help="取得・書き込み中のメッセージを表示する")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    runs = [
+        run_benchmark(
+            args.days, args.contacts, args.backend, args.concurrency, args.page_latency,
+            args.sheets_latency, args.active_ratio, verbose=args.verbose,
+        )
+        for _ in range(args.repeat)
+    ]
+    summary = summarize_runs(runs)
+    print_summary(runs, summary)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, ensure_ascii=False, indent=2)
+    return summary
+
+if __name__ == "__main__":
+    main()
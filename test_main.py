@@ -1,60 +1,712 @@
+import csv
+import json
 import os
-import time
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import gspread
-from google.oauth2.service_account import Credentials
-
-def main():
-    driver = None
-    all_data = []
+import threading
+import urllib.error
+import urllib.request
 
+import pytest
+
+import ambi_auto_calculation as ambi
+from ambi_fixtures import (
+    FakeSpreadsheet,
+    FixturePageRenderer,
+    FixtureServer,
+    fixture_contact_names,
+    fixture_settings,
+    iter_dates,
+    load_fixture,
+)
+from benchmark import run_benchmark
+
+# AMBI・Google Sheetsに接続せずに、保存済みページ（fixtures/ambi）とFakeSpreadsheetで取得から書き込みまでを確認する
+
+@pytest.fixture
+def fixture_server():
+    with FixtureServer(fixture_contact_names(3)) as server:
+        yield server
+
+@pytest.fixture
+def offline_ambi(fixture_server, tmp_path, monkeypatch):
+    """
+    ambi_auto_calculationの接続先をフィクスチャサーバーに、作業ディレクトリを一時ディレクトリに向ける
+    """
+    monkeypatch.chdir(tmp_path)
+    for name, value in fixture_settings(fixture_server, str(tmp_path / ".ambi_state")).items():
+        monkeypatch.setattr(ambi, name, value)
+    # ローカルのサーバーのため、取得頻度を制限しない
+    monkeypatch.setattr(ambi, "FETCH_RATE_PER_SEC", 0)
+    ambi.RUN_METRICS.reset()
+    return fixture_server
+
+def test_parse_saved_pages():
+    platinum = ambi.parse_stats_page(load_fixture("platinum"))
+    regular = ambi.parse_stats_page(load_fixture("regular"))
+    interested = ambi.parse_stats_page(load_fixture("interested"))
+
+    assert [record.contact_name for record in platinum] == ["山中沙矢", "橘萌生", "奥野翔子"]
+    assert all(isinstance(record, ambi.ScoutStats) for record in platinum + regular)
+    assert all(isinstance(record, ambi.InterestStats) for record in interested)
+    assert platinum[0].send_count == 12 and platinum[0].open_rate == 41.7
+    assert platinum[1].post_opening_entry_rate is None
+    assert regular[0].send_count == 1204
+    assert interested[0].interested_count == 4 and interested[2].entry_rate is None
+
+def test_page_without_results_table_is_an_error():
+    with pytest.raises(ambi.StatsPageError):
+        ambi.parse_stats_page(load_fixture("maintenance"))
+    with pytest.raises(ambi.StatsPageError):
+        ambi.parse_stats_page(load_fixture("login"))
+
+def test_maintenance_page_is_not_cached_as_zero_activity(offline_ambi, tmp_path):
+    argv = ["--from", "2025-01-01", "--to", "2025-01-10", "--output", "csv", "--output-path", "out.csv"]
+    offline_ambi.serve_maintenance(1)
+    assert ambi.main(argv)["status"] == "error"
+    assert offline_ambi.requests["maintenance"] == 1
+
+    # 次の実行で取得し直し、全日の値がAMBIの値と一致する
+    assert ambi.main(argv)["status"] == "ok"
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len({(row["date"], row["data_type"], row["contact_name"]) for row in rows}) == 10 * 3 * 3
+    for row in rows:
+        expected = offline_ambi.renderer.daily_counts(row["data_type"], row["contact_name"], row["date"])
+        assert {key: int(row[key]) for key in expected} == expected
+
+def test_resume_fetches_only_missing_pages(offline_ambi, tmp_path, monkeypatch):
+    # 日別ページだけで取得し、キャッシュを使わずにチェックポイントだけで再開する
+    monkeypatch.setattr(ambi, "RANGE_FETCH", False)
+    argv = [
+        "--from", "2025-01-01", "--to", "2025-01-10", "--output", "csv", "--output-path", "out.csv",
+        "--concurrency", "1", "--force-refresh",
+    ]
+    offline_ambi.serve_maintenance(5, after=12)
+    assert ambi.main(argv)["status"] == "error"
+    fetched = len(ambi.RunCheckpoint.load(ambi.CHECKPOINT_FILE).fetched)
+    assert 12 <= fetched < 10 * 3
+
+    # 期間・出力先が異なる場合は再開しない
+    offline_ambi.requests.clear()
+    for changed in (["--to", "2025-01-09"], ["--output-path", "other.csv"]):
+        assert ambi.main(argv + changed + ["--resume"])["status"] == "error"
+    assert offline_ambi.requests["page"] == 0
+    assert not (tmp_path / "other.csv").exists()
+
+    # dry-runの再開はチェックポイントを読むだけで、記録・削除しない
+    with open(ambi.CHECKPOINT_FILE, encoding="utf-8") as f:
+        saved_checkpoint = f.read()
+    assert ambi.main(argv + ["--resume", "--dry-run"])["status"] == "ok"
+    with open(ambi.CHECKPOINT_FILE, encoding="utf-8") as f:
+        assert f.read() == saved_checkpoint
+
+    # 保存済みのログインセッションの確認の1ページと、前回取得できなかったページだけを取得する
+    offline_ambi.requests.clear()
+    assert ambi.main(argv + ["--resume"])["status"] == "ok"
+    assert offline_ambi.requests["page"] == 1 + (10 * 3 - fetched)
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len({(row["date"], row["data_type"], row["contact_name"]) for row in rows}) == 10 * 3 * 3
+    for row in rows:
+        expected = offline_ambi.renderer.daily_counts(row["data_type"], row["contact_name"], row["date"])
+        assert {key: int(row[key]) for key in expected} == expected
+
+def test_checkpoint_appends_progress_and_skips_a_partial_line(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    tasks = [("2025-01-01", "platinum"), ("2025-01-02", "platinum")]
+    records = ambi.parse_stats_page(load_fixture("platinum"))
+    checkpoint = ambi.RunCheckpoint.start(path, tasks, {"output": "csv"})
+    checkpoint.record_fetched("2025-01-01", "platinum", records)
+    checkpoint.record_written(["2025-01-01"], ["platinum"])
+    checkpoint.record_fetched("2025-01-02", "platinum", records)
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+    # 書き込み途中で止まった行
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"fetched": "2025-01-03|plat')
+
+    loaded = ambi.RunCheckpoint.load(path)
+    assert loaded.options == {"output": "csv"}
+    assert loaded.unwritten_tasks() == [("2025-01-02", "platinum")]
+    assert loaded.fetched_results() == {task: records for task in tasks}
+
+def test_selenium_page_load_timeout_is_an_error(monkeypatch):
+    from selenium.common.exceptions import NoSuchElementException
+
+    class UnreadyDriver:
+        # 集計表が表示されないままのブラウザ
+        page_source = "<html><body><table><tr><td>layout</td></tr></table></body></html>"
+        requested = 0
+
+        def get(self, url):
+            self.requested += 1
+
+        def find_element(self, by, value):
+            raise NoSuchElementException(value)
+
+    monkeypatch.setattr(ambi, "PAGE_LOAD_TIMEOUT", 0.05)
+    ambi.RUN_METRICS.reset()
+    driver = UnreadyDriver()
+    with pytest.raises(ambi.StatsPageError):
+        ambi.SeleniumClient(driver).load_page("http://example.invalid/")
+    assert driver.requested == 1 + ambi.PAGE_LOAD_RETRIES
+    assert ambi.RUN_METRICS.count("page_load_timeouts") == 1 + ambi.PAGE_LOAD_RETRIES
+
+def test_range_page_is_sum_of_days():
+    renderer = FixturePageRenderer(fixture_contact_names(5))
+    dates = list(iter_dates("2025-01-01", "2025-01-14"))
+    for data_type in ambi.ENDPOINTS:
+        totals = ambi.parse_stats_page(renderer.render(data_type, dates[0], dates[-1]))
+        days = [ambi.parse_stats_page(renderer.render(data_type, date, date)) for date in dates]
+        for index, total in enumerate(totals):
+            for key, value in ambi.get_stats_counts(total).items():
+                assert value == sum(ambi.get_stats_counts(day[index])[key] for day in days)
+
+def test_history_rollup_rates_match_ambi_range_page(tmp_path):
+    import math
+
+    renderer = FixturePageRenderer(fixture_contact_names(3), active_ratio=0.8)
+    dates = list(iter_dates("2025-01-01", "2025-01-31"))
+    conn = ambi.open_history_store(str(tmp_path / "history.sqlite3"))
+    for data_type in ambi.ENDPOINTS:
+        for date in dates:
+            ambi.append_history(conn, date, data_type, ambi.parse_stats_page(renderer.render(data_type, date, date)))
+    totals = ambi.aggregate_history(conn, "M")
+    conn.close()
+
+    # 月の合計から計算した率が、AMBIの期間指定のページに表示される率と一致する
+    for data_type in ambi.ENDPOINTS:
+        for record in ambi.parse_stats_page(renderer.render(data_type, dates[0], dates[-1])):
+            row = totals[(totals["data_type"] == data_type) & (totals["contact_name"] == record.contact_name)].iloc[0]
+            for rate in ambi.HISTORY_RATE_DEFINITIONS:
+                if not hasattr(record, rate):
+                    assert math.isnan(row[rate])
+                elif getattr(record, rate) is None:
+                    assert math.isnan(row[rate])
+                else:
+                    assert row[rate] == pytest.approx(getattr(record, rate), abs=0.05)
+
+@pytest.mark.parametrize("active_ratio, data_type, max_pages", [
+    # 件数のある日が多い場合は、期間の合計値の1ページだけを追加して日別に取得する
+    (0.3, "platinum", 60 + 1),
+    # 件数の少ない期間は二分割して、0件の期間の日別取得を省く
+    (0.01, "regular", 20),
+    (0.0, "platinum", 1),
+])
+def test_range_fetch_pages_and_results(active_ratio, data_type, max_pages, tmp_path, monkeypatch):
+    contact_names = fixture_contact_names(3)
+    dates = list(iter_dates("2025-01-01", "2025-03-01"))
+    with FixtureServer(contact_names, active_ratio) as server:
+        for name, value in fixture_settings(server, str(tmp_path)).items():
+            monkeypatch.setattr(ambi, name, value)
+        monkeypatch.setattr(ambi, "FETCH_RATE_PER_SEC", 0)
+        client = ambi.create_fetch_client("http")
+        results = ambi.fetch_range_by_contact_names(client, data_type, dates)
+        client.close()
+
+    assert server.requests["page"] <= max_pages
+    for date in dates:
+        assert {
+            record.contact_name: ambi.get_stats_counts(record) for record in results[date]
+        } == {name: server.renderer.daily_counts(data_type, name, date) for name in contact_names}
+
+def test_http_client_logs_in_again_after_session_expires(offline_ambi):
+    client = ambi.create_fetch_client("http")
+    results = ambi.fetch_data_by_contact_names(client, "2025-01-06", "platinum", ["橘萌生"])
+    expected = offline_ambi.renderer.daily_counts("platinum", "橘萌生", "2025-01-06")
+    assert ambi.get_stats_counts(results[0]) == expected
+
+    offline_ambi.expire_sessions()
+    ambi.fetch_data_by_contact_names(client, "2025-01-07", "platinum")
+    client.close()
+
+    assert offline_ambi.requests["login"] == 2
+    assert offline_ambi.requests["expired"] == 1
+    assert ambi.RUN_METRICS.count("http_requests") == offline_ambi.requests.total()
+
+def test_expired_saved_cookies_go_through_login_and_fallback(offline_ambi, monkeypatch):
+    ambi.create_fetch_client("http").close()
+    offline_ambi.expire_sessions()
+
+    # httpでログインできない状態にし、切り替え先（通常はSelenium）としてログインできるクライアントを使う
+    http_login = ambi.HttpClient.login
+
+    class FallbackClient(ambi.HttpClient):
+        def login(self):
+            return http_login(self)
+
+    monkeypatch.setattr(ambi.HttpClient, "login", lambda self: False)
+    monkeypatch.setitem(ambi.FETCH_BACKENDS, "fallback", FallbackClient)
+    monkeypatch.setitem(ambi.FETCH_FALLBACKS, "http", "fallback")
+
+    # 保存済みCookieのセッションが切れている場合は、取得を始める前にログイン・切り替えを行う
+    client = ambi.create_fetch_client("http")
+    results = ambi.fetch_data_by_contact_names(client, "2025-01-06", "platinum")
+    client.close()
+    assert isinstance(client, FallbackClient)
+    assert len(results) == 3
+    assert offline_ambi.requests["login"] == 2
+
+def test_session_probe_error_goes_through_login(offline_ambi, monkeypatch):
+    import requests
+
+    ambi.create_fetch_client("http").close()
+
+    # 保存済みCookieの確認のページだけが5xxで失敗する（切り替え先は使わない）
+    load_page = ambi.HttpClient.load_page
+    failures = []
+
+    def fail_first_page(self, url):
+        if not failures:
+            failures.append(url)
+            raise requests.HTTPError("503 Server Error: Service Unavailable")
+        return load_page(self, url)
+
+    monkeypatch.setattr(ambi.HttpClient, "load_page", fail_first_page)
+    monkeypatch.setattr(ambi, "FETCH_FALLBACKS", {})
+    client = ambi.create_fetch_client("http")
+    results = ambi.fetch_data_by_contact_names(client, "2025-01-06", "platinum")
+    client.close()
+    assert len(failures) == 1
+    assert len(results) == 3
+    assert offline_ambi.requests["login"] == 2
+
+def test_client_pool_closes_drivers_when_a_login_fails(monkeypatch):
+    class FakeDriverClient:
+        def __init__(self):
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    created = []
+    lock = threading.Lock()
+
+    def create_fetch_client(backend=None, rate_limiter=None, driver_profile=None):
+        with lock:
+            if len(created) == 2:
+                created.append(None)
+                raise RuntimeError("AMBIサイトにログインできませんでした。")
+            client = FakeDriverClient()
+            created.append(client)
+            return client
+
+    monkeypatch.setattr(ambi, "create_fetch_client", create_fetch_client)
+    with pytest.raises(RuntimeError):
+        ambi.create_client_pool(5, "selenium")
+    clients = [client for client in created if client]
+    assert len(clients) == 4
+    assert all(client.closed for client in clients)
+
+def test_chromedriver_path_is_resolved_again_after_version_mismatch(tmp_path, monkeypatch):
+    import selenium.webdriver
+    import webdriver_manager.chrome
+    from selenium.common.exceptions import SessionNotCreatedException
+
+    old_path, new_path = tmp_path / "chromedriver-old", tmp_path / "chromedriver-new"
+    old_path.write_text(""), new_path.write_text("")
+    monkeypatch.setattr(ambi, "DRIVER_PATH_FILE", str(tmp_path / "chromedriver_path"))
+    ambi.write_state_file(ambi.DRIVER_PATH_FILE, str(old_path))
+
+    class FakeChromeDriverManager:
+        def install(self):
+            return str(new_path)
+
+    class FakeChrome:
+        def __init__(self, service, options):
+            if service.path == str(old_path):
+                raise SessionNotCreatedException("This version of ChromeDriver only supports Chrome version 120")
+            self.service = service
+
+        def execute(self, driver_command, params=None):
+            return {}
+
+    monkeypatch.setattr(webdriver_manager.chrome, "ChromeDriverManager", FakeChromeDriverManager)
+    monkeypatch.setattr(selenium.webdriver, "Chrome", FakeChrome)
+
+    driver = ambi.setup_driver("server")
+    assert driver.service.path == str(new_path)
+    with open(ambi.DRIVER_PATH_FILE, encoding="utf-8") as f:
+        assert f.read() == str(new_path)
+
+def test_pipeline_writes_to_fake_spreadsheet(offline_ambi):
+    contact_names = fixture_contact_names(3)
+    dates = list(iter_dates("2025-01-01", "2025-01-10"))
+    tasks = [(date, data_type) for date in dates for data_type in ambi.ENDPOINTS]
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+
+    def sync():
+        writer = ambi.GoogleSheetsWriter()
+        writer.spreadsheet = spreadsheet
+        client_pool = ambi.create_client_pool(2, "http")
+        try:
+            ambi.run_sync_pipeline(client_pool, tasks, {}, contact_names, writer, batch_days=5, max_workers=2)
+        finally:
+            ambi.close_client_pool(client_pool)
+            writer.close()
+        return writer
+
+    writer = sync()
+    sheet = spreadsheet.worksheets["2025.01"]
+    row = ambi.data_entry_position("奥野翔子", "interested")
+    column = ambi.get_column_from_date("2025-01-03")
+    expected = offline_ambi.renderer.daily_counts("interested", "奥野翔子", "2025-01-03")["interested_count"]
+    assert sheet.cell_value(row, column) == str(expected)
+    assert writer.stats["cells"] == len(dates) * len(contact_names) * 8
+    # シート全体ではなく、書き込み先の範囲だけを1回で読み込む
+    assert spreadsheet.calls["get_all_values"] == 0
+    assert spreadsheet.calls["batch_get"] == 1
+    assert spreadsheet.calls["batch_update"] == 2
+
+    # 2回目はシートが更新されていないため、スナップショットを使って読み込まず、値も変わらないため書き込まない
+    writer = sync()
+    assert writer.stats["cells"] == 0
+    assert writer.stats["snapshot_hits"] == 1
+    assert spreadsheet.calls["batch_get"] == 1
+    assert spreadsheet.calls["batch_update"] == 2
+
+    # 手で編集された場合は読み込み直して、元の値に書き戻す
+    sheet.set_cell_value(row, column, "999")
+    writer = sync()
+    assert writer.stats["cells"] == 1
+    assert sheet.cell_value(row, column) == str(expected)
+    assert spreadsheet.calls["batch_get"] == 2
+
+def test_sheets_writer_splits_dates_by_month_tab(offline_ambi):
+    import gspread
+
+    contact_names = fixture_contact_names(3)
+    dates = list(iter_dates("2025-01-30", "2025-02-02"))
+    results = {
+        (date, data_type): ambi.parse_stats_page(offline_ambi.renderer.render(data_type, date, date))
+        for date in dates
+        for data_type in ambi.ENDPOINTS
+    }
+    entries = ambi.build_scout_entries(results, dates, list(ambi.ENDPOINTS), contact_names)
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01", "2025.02"])
+    writer = ambi.GoogleSheetsWriter()
+    writer.spreadsheet = spreadsheet
+    writer.write(entries)
+
+    # 各日はその月のシートの、日付の列に書き込まれる
+    row = ambi.data_entry_position("橘萌生", "platinum")
+    for date in dates:
+        sheet = spreadsheet.worksheets[date[:7].replace("-", ".")]
+        expected = offline_ambi.renderer.daily_counts("platinum", "橘萌生", date)["send_count"]
+        assert sheet.cell_value(row, ambi.get_column_from_date(date)) == str(expected)
+    assert spreadsheet.worksheets["2025.01"].cell_value(row, ambi.get_column_from_date("2025-02-01")) == ""
+    assert writer.stats["cells"] == len(dates) * len(contact_names) * 8
+    # 月ごとに1回ずつ開き、1回ずつ書き込む
+    assert spreadsheet.calls["worksheet"] == 2
+    assert spreadsheet.calls["batch_update"] == 2
+
+    # 月のシートがない場合はエラーにする
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+    writer = ambi.GoogleSheetsWriter()
+    writer.spreadsheet = spreadsheet
+    with pytest.raises(gspread.exceptions.WorksheetNotFound):
+        writer.write(entries)
+
+def test_month_read_ranges_cover_layout_rows(offline_ambi):
+    # 担当者の間の空白行（5行）は1つの範囲にまとめ、列は2月の28日分（G〜AH）
+    assert ambi.build_month_read_ranges("2025.02") == ["G20:AH65"]
+    rows = ambi.get_layout_index().values()
+    assert ambi.group_rows(rows, max_gap=4) == [(20, 31), (37, 48), (54, 65)]
+    assert ambi.group_rows([1, 2, 8, 20], max_gap=5) == [(1, 8), (20, 20)]
+
+def test_sheets_writer_retries_rate_limited_calls(offline_ambi):
+    contact_names = fixture_contact_names(3)
+    dates = list(iter_dates("2025-01-01", "2025-01-03"))
+    results = {
+        (date, data_type): ambi.parse_stats_page(offline_ambi.renderer.render(data_type, date, date))
+        for date in dates
+        for data_type in ambi.ENDPOINTS
+    }
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+    spreadsheet.fail_next("batch_get", 503)
+    spreadsheet.fail_next("batch_update", 429, 429)
+    writer = ambi.GoogleSheetsWriter(quota=ambi.SheetsQuotaController(backoff_base=0.01))
+    writer.spreadsheet = spreadsheet
+
+    writer.write(ambi.build_scout_entries(results, dates, list(ambi.ENDPOINTS), contact_names))
+
+    assert writer.stats["cells"] == len(dates) * len(contact_names) * 8
+    assert spreadsheet.calls["batch_update"] == 3
+    assert ambi.RUN_METRICS.count("sheets_retries") == 3
+    # 429の後は書き込みの上限を下げ、成功した分だけ戻す
+    assert writer.quota.limits["write"] == 60 / 4 + 1
+
+def test_sheets_writer_gives_up_on_client_errors(offline_ambi):
+    from gspread.exceptions import APIError
+
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+    spreadsheet.fail_next("worksheet", 400)
+    writer = ambi.GoogleSheetsWriter(quota=ambi.SheetsQuotaController(backoff_base=0.01))
+    writer.spreadsheet = spreadsheet
+
+    with pytest.raises(APIError):
+        writer.get_worksheet("2025.01")
+    assert ambi.RUN_METRICS.count("sheets_retries") == 0
+
+def test_quota_paces_calls_within_window():
+    ambi.RUN_METRICS.reset()
+    quota = ambi.SheetsQuotaController(read_per_minute=2, window=0.2)
+    for _ in range(2):
+        quota.call("read", lambda: None)
+    assert not quota.can_call("read") and quota.can_call("write")
+
+    # 3回目は最初の呼び出しがwindowの外に出るまで待つ
+    quota.call("read", lambda: None)
+    assert ambi.RUN_METRICS.total("quota_wait") > 0.1
+
+def test_pipeline_coalesces_writes_while_throttled(offline_ambi):
+    contact_names = fixture_contact_names(3)
+    dates = list(iter_dates("2025-01-01", "2025-01-10"))
+    tasks = [(date, data_type) for date in dates for data_type in ambi.ENDPOINTS]
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+    writer = ambi.GoogleSheetsWriter(quota=ambi.SheetsQuotaController(write_per_minute=1, window=1.0))
+    writer.spreadsheet = spreadsheet
+    client_pool = ambi.create_client_pool(2, "http")
     try:
-        # Webドライバーの設定
-        driver = setup_driver()
-
-        # AMBIにログイン
-        if not login_to_ambi(driver):
-            return
-
-        # データ収集
-        today = datetime.today()
-        start_date = today - timedelta(days=3)  # 過去7日分
-        # 指定するjobNameのリスト
-        target_job_names = ["山中沙矢", "橘萌生", "奥野翔子"]
-
-        for single_date in (start_date + timedelta(n) for n in range(3)):
-            formatted_date = single_date.strftime("%Y-%m-%d")
-            print(f"\n{formatted_date}のデータ収集を開始:")
-
-            for data_type in ENDPOINTS.keys():
-                data = fetch_data_by_job_names(driver, formatted_date, data_type, target_job_names)
-                
-                for entry in data:
-                    all_data.append({
-                        "date": formatted_date,
-                        "data_type": data_type,
-                        "jobName": entry["jobName"],
-                        "data": entry["data"]
-                    })
-
-                time.sleep(1)
-
-        # データをGoogleスプレッドシートに書き込む
-        write_to_google_sheets(all_data)
-
-    except Exception as e:
-        print(f"スクリプト実行中に致命的なエラーが発生しました: {e}")
+        ambi.run_sync_pipeline(client_pool, tasks, {}, contact_names, writer, batch_days=1, max_workers=2)
     finally:
-        if driver:
-            driver.quit()
+        ambi.close_client_pool(client_pool)
+
+    # 1日ずつ書き込む設定でも、上限の待機中にそろった日はまとめて書き込む
+    assert writer.stats["cells"] == len(dates) * len(contact_names) * 8
+    assert spreadsheet.calls["batch_update"] < len(dates)
+
+def test_main_appends_csv_and_writes_run_report(offline_ambi, tmp_path):
+    argv = ["--from", "2025-01-01", "--to", "2025-01-03", "--output", "csv", "--output-path", "out.csv"]
+    ambi.main(argv)
+    ambi.main(argv)
+
+    with open(tmp_path / "out.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 3 * 3 * 3
+    with open(tmp_path / ".ambi_state" / "run_metrics.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["status"] == "ok"
+    # 2回目は確定済みの日をキャッシュから読み込むため、ページを取得しない
+    assert report["counters"].get("pages", 0) == 0
+
+@pytest.mark.parametrize("writer_class", [ambi.CsvWriter, ambi.NdjsonWriter])
+def test_file_export_keeps_newest_values(writer_class, tmp_path):
+    def entries(date, send_count):
+        record = ambi.build_stats_record(["橘萌生", str(send_count)] + ["1"] * 8, ambi.ScoutStats)
+        return [{"date": date, "data_type": "platinum", "contact_name": "橘萌生", "stats": record}]
+
+    def export(*batches):
+        writer = writer_class(str(tmp_path / "out"))
+        for batch in batches:
+            writer.write(batch)
+        writer.close()
+        return writer
+
+    export(entries("2025-01-01", 5), entries("2025-01-02", 3))
+    # 2日は取得した時点ではまだ確定していなかったため、次の実行で値が変わる
+    writer = export(entries("2025-01-01", 5), entries("2025-01-02", 8), entries("2025-01-03", 1))
+    assert (writer.rows, writer.updated, writer.skipped) == (1, 1, 1)
+
+    reloaded = writer_class(str(tmp_path / "out"))
+    reloaded.open()
+    reloaded.close()
+    assert list(reloaded.lines) == [
+        ("2025-01-01", "platinum", "橘萌生"), ("2025-01-02", "platinum", "橘萌生"), ("2025-01-03", "platinum", "橘萌生"),
+    ]
+    assert reloaded.lines[("2025-01-02", "platinum", "橘萌生")] == writer.format_row(ambi.build_export_row(entries("2025-01-02", 8)[0]))
+
+def test_main_writes_parquet_and_reports_close_errors(offline_ambi, tmp_path, monkeypatch):
+    import pandas as pd
+
+    argv = ["--from", "2025-01-01", "--to", "2025-01-02", "--output", "parquet", "--output-path", "out.parquet"]
+    assert ambi.main(argv)["status"] == "ok"
+    assert len(pd.read_parquet(tmp_path / "out.parquet")) == 2 * 3 * 3
+
+    def fail_close(self):
+        raise ImportError("Unable to find a usable engine")
+
+    monkeypatch.setattr(ambi.ParquetWriter, "close", fail_close)
+    report = ambi.main(argv)
+    assert report["status"] == "error" and "usable engine" in report["error"]
+    with open(tmp_path / ".ambi_state" / "run_metrics.json", encoding="utf-8") as f:
+        assert json.load(f)["status"] == "error"
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+def test_parquet_keeps_earlier_rows_across_runs_and_resume(offline_ambi, tmp_path):
+    import pandas as pd
+
+    def read_rows():
+        frame = pd.read_parquet(tmp_path / "out.parquet")
+        return {(row.date, row.data_type, row.contact_name): row for row in frame.itertuples()}
+
+    argv = ["--output", "parquet", "--output-path", "out.parquet", "--concurrency", "1", "--force-refresh"]
+    # 日ごとの実行で、前回までの日の行を残す
+    assert ambi.main(argv + ["--from", "2025-01-01", "--to", "2025-01-02"])["status"] == "ok"
+    assert ambi.main(argv + ["--from", "2025-01-02", "--to", "2025-01-03"])["status"] == "ok"
+    assert len(read_rows()) == 3 * 3 * 3
+
+    # 途中で失敗した実行を再開しても、失敗した実行で保存した行と合わせて全日分になる
+    argv += ["--from", "2025-01-04", "--to", "2025-01-13"]
+    offline_ambi.serve_maintenance(5, after=12)
+    assert ambi.main(argv)["status"] == "error"
+    assert os.path.exists(ambi.CHECKPOINT_FILE)
+    assert ambi.main(argv + ["--resume"])["status"] == "ok"
+    assert not os.path.exists(ambi.CHECKPOINT_FILE)
+
+    rows = read_rows()
+    assert len(rows) == 13 * 3 * 3
+    for (date, data_type, contact_name), row in rows.items():
+        expected = offline_ambi.renderer.daily_counts(data_type, contact_name, date)
+        assert {key: int(getattr(row, key)) for key in expected} == expected
+
+def test_benchmark_runs_offline():
+    result = run_benchmark(days=3, contacts=2, concurrency=2)
+    assert result["pages"] > 0
+    assert result["cells_written"] == 3 * 2 * 8
+    assert result["sheets_calls"]["batch_update"] >= 1
+
+def test_accounts_run_in_separate_processes(offline_ambi, tmp_path, monkeypatch):
+    monkeypatch.setenv("PASSWORD_B", "fixture-password")
+    (tmp_path / "accounts.json").write_text(json.dumps([
+        {"name": "a", "pk": "AAA111", "login_id": "fixture-user", "password": "fixture-password"},
+        {"name": "b", "pk": "BBB222", "login_id": "fixture-user", "password_env": "PASSWORD_B"},
+    ]), encoding="utf-8")
+    monkeypatch.setattr(ambi, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+
+    summary = ambi.main([
+        "--from", "2025-01-01", "--to", "2025-01-02", "--output", "csv", "--accounts", "all", "--account-workers", "2",
+    ])
+
+    assert summary["status"] == "ok"
+    assert set(summary["accounts"]) == {"a", "b"}
+    assert (tmp_path / "ambi_data_a.csv").exists() and (tmp_path / "ambi_data_b.csv").exists()
+    assert (tmp_path / ".ambi_state" / "accounts" / "a" / "cookies.json").exists()
+    # アカウントごとにログインする
+    assert offline_ambi.requests["login"] == 2
+
+def read_prometheus_textfile(path):
+    """
+    textfileの # TYPE の行と、{(メトリクス名, ラベル): 値} を返す
+    """
+    types, samples = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f.read().splitlines():
+            if line.startswith("# TYPE "):
+                _, _, name, metric_type = line.split(" ")
+                types[name] = metric_type
+            elif line and not line.startswith("#"):
+                sample, value = line.rsplit(" ", 1)
+                name, _, labels = sample.partition("{")
+                samples[(name, labels.rstrip("}"))] = float(value)
+    return types, samples
+
+def test_main_writes_prometheus_textfile(offline_ambi, tmp_path, monkeypatch):
+    argv = ["--from", "2025-01-01", "--to", "2025-01-02", "--output", "csv", "--metrics-prom", "metrics.prom"]
+    report = ambi.main(argv)
+    assert report["status"] == "ok"
+
+    types, samples = read_prometheus_textfile(tmp_path / "metrics.prom")
+    assert types == {
+        name: "gauge"
+        for name in (
+            "ambi_run_success", "ambi_run_timestamp_seconds", "ambi_run_duration_seconds",
+            "ambi_phase_seconds", "ambi_phase_max_seconds", "ambi_phase_calls", "ambi_run_events",
+        )
+    }
+    assert samples[("ambi_run_success", "")] == 1
+    assert samples[("ambi_run_events", 'event="http_requests"')] == report["counters"]["http_requests"]
+    for phase, summary in report["phases"].items():
+        assert samples[("ambi_phase_calls", f'phase="{phase}"')] == summary["count"]
+    assert {name for name, _ in samples} == set(types)
+
+    # アカウント一覧から実行した場合は、アカウントごとのファイルの全項目にaccountラベルを付ける
+    (tmp_path / "accounts.json").write_text(json.dumps([
+        {"name": "a", "pk": "AAA111", "login_id": "fixture-user", "password": "fixture-password"},
+    ]), encoding="utf-8")
+    monkeypatch.setattr(ambi, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+    assert ambi.main(argv + ["--accounts", "a", "--account-workers", "1"])["status"] == "ok"
+    types, samples = read_prometheus_textfile(tmp_path / "metrics_a.prom")
+    assert samples[("ambi_run_success", 'account="a"')] == 1
+    assert ("ambi_run_events", 'account="a",event="http_requests"') in samples
+    assert all(labels.startswith('account="a"') for _, labels in samples)
+
+def test_account_settings_do_not_leak_between_accounts_in_a_reused_process(offline_ambi, tmp_path, monkeypatch):
+    # aだけが1人分のレイアウトを指定する。1プロセスでa→b→cの順に集計し、bとcは既定のレイアウト（3人）に戻ること
+    (tmp_path / "layout_a.json").write_text(json.dumps({"山中沙矢": {"platinum": 20, "regular": 25, "interested": 30}}), encoding="utf-8")
+    (tmp_path / "accounts.json").write_text(json.dumps([
+        {"name": "a", "pk": "AAA111", "login_id": "fixture-user", "password": "fixture-password",
+         "spreadsheet": "ClientA book", "sheet_layout": "layout_a.json"},
+        {"name": "b", "pk": "BBB222", "login_id": "fixture-user", "password": "fixture-password"},
+        {"name": "c", "pk": "CCC333", "login_id": "fixture-user", "password": "fixture-password"},
+    ]), encoding="utf-8")
+    monkeypatch.setattr(ambi, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+
+    summary = ambi.main([
+        "--from", "2025-01-01", "--to", "2025-01-01", "--output", "csv", "--accounts", "all", "--account-workers", "1",
+    ])
+
+    assert summary["status"] == "ok"
+    rows = {}
+    for name in "abc":
+        with open(tmp_path / f"ambi_data_{name}.csv", newline="", encoding="utf-8") as f:
+            rows[name] = {row["contact_name"] for row in csv.DictReader(f)}
+    assert rows["a"] == {"山中沙矢"}
+    assert rows["b"] == rows["c"] == set(ambi.DEFAULT_SHEET_LAYOUT)
+
+def test_daemon_reuses_login_and_sheets_connection(offline_ambi, tmp_path, monkeypatch):
+    spreadsheet = FakeSpreadsheet(sheet_names=["2025.01"])
+    monkeypatch.setattr(ambi.GoogleSheetsWriter, "connect", lambda self: spreadsheet)
+    daemon = ambi.SyncDaemon(["--output", "sheets", "--concurrency", "2"], interval=0, trigger_port=0).open()
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+
+    def post(path):
+        with urllib.request.urlopen(urllib.request.Request(daemon.trigger_url + path, method="POST")) as response:
+            return json.load(response)
+
+    try:
+        first = post("/sync?from=2025-01-01&to=2025-01-03")
+        second = post("/sync?from=2025-01-04&to=2025-01-05")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post("/sync?from=2025-01-05&to=2025-01-01")
+        assert error.value.code == 400
+    finally:
+        post("/stop")
+        thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert first["status"] == "ok" and second["status"] == "ok"
+    assert second["writer"]["cells"] == 2 * 3 * 8
+    # 2回目の実行ではログインせず、ワークシートも開き直さない
+    assert offline_ambi.requests["login"] == 1
+    assert spreadsheet.calls["worksheet"] == 1
+    # 1回目の書き込み後のリビジョンを覚えているため、2回目は値を読み込み直さない
+    assert spreadsheet.calls["batch_get"] == 1
+
+def test_daemon_trigger_rejects_browser_and_unauthenticated_requests(offline_ambi, monkeypatch):
+    monkeypatch.setattr(ambi, "DAEMON_TRIGGER_TOKEN", "fixture-token")
+    daemon = ambi.SyncDaemon(["--output", "csv"], interval=0, trigger_port=0).open()
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+
+    def post(path, headers):
+        request = urllib.request.Request(daemon.trigger_url + path, method="POST", headers=headers)
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    try:
+        # ブラウザで開いたページからの要求（Originあり）と、トークンのない要求は実行しない
+        for headers, status in [
+            ({"Origin": "https://example.com", "X-AMBI-Token": "fixture-token"}, 403),
+            ({}, 401),
+            ({"X-AMBI-Token": "wrong-token"}, 401),
+        ]:
+            for path in ("/stop", "/sync?force_refresh=1"):
+                with pytest.raises(urllib.error.HTTPError) as error:
+                    post(path, headers)
+                assert error.value.code == status
+        assert thread.is_alive()
+        assert daemon.last_report is None
+    finally:
+        post("/stop", {"X-AMBI-Token": "fixture-token"})
+        thread.join(timeout=10)
+    assert not thread.is_alive()
@@ -0,0 +1,66 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+# 起動時間の確認（import時に重いライブラリを読み込まず、キャッシュ済みのCSV出力がすぐに終わること）
+# 読み込み済みのモジュールの影響を受けないよう、別のPythonプロセスで計測する
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["selenium", "webdriver_manager", "gspread", "google.oauth2", "requests", "bs4", "pandas"]
+IMPORT_TIME_LIMIT = 0.5  # 秒
+CACHED_RUN_TIME_LIMIT = 1.0  # 秒
+
+def run_python(code, cwd):
+    """
+    別プロセスでcodeを実行し、最後に出力されたJSONを返す
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    completed = subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def test_import_does_not_load_backends(tmp_path):
+    result = run_python(f"""
+        import json, sys, time
+        started_at = time.perf_counter()
+        import ambi_auto_calculation
+        elapsed = time.perf_counter() - started_at
+        loaded = [name for name in {HEAVY_MODULES + ["dotenv"]!r} if name in sys.modules]
+        print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+    """, tmp_path)
+
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_TIME_LIMIT
+
+def test_cached_csv_run_starts_quickly(tmp_path):
+    result = run_python(f"""
+        import json, sys, time
+        started_at = time.perf_counter()
+        import ambi_auto_calculation as ambi
+
+        dates = ["2025-01-01", "2025-01-02"]
+        cache = ambi.open_stats_cache()
+        ambi.save_cached_results(cache, {{
+            (date, data_type): [ambi.build_stats_record(
+                ["橘萌生"] + ["1"] * (7 if data_type == "interested" else 9),
+                ambi.InterestStats if data_type == "interested" else ambi.ScoutStats,
+            )]
+            for date in dates
+            for data_type in ambi.ENDPOINTS
+        }})
+        cache.close()
+
+        ambi.main(["--from", dates[0], "--to", dates[-1], "--output", "csv", "--contacts", "橘萌生"])
+        elapsed = time.perf_counter() - started_at
+        loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+        print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+    """, tmp_path)
+
+    assert result["loaded"] == []
+    assert result["elapsed"] < CACHED_RUN_TIME_LIMIT
+    with open(tmp_path / "ambi_data.csv", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 1 + 2 * 3